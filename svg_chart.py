@@ -20,9 +20,35 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import drawsvg as draw
+import array
+import csv
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import logging
 import math
+import mmap
+import os
+import pickle
+import struct
+import sys
+import threading
+import time
+import traceback
+import unicodedata
+from collections import deque
+from contextlib import contextmanager, nullcontext
 from enum import Enum
+from functools import lru_cache
+
+# drawsvg, asyncio and process pools are imported when first used, so importing this module
+# (and starting the command line renderer) stays fast
+
+# Silent by default, applications can enable it with logging configuration
+logger = logging.getLogger("svg_chart")
+logger.addHandler(logging.NullHandler())
 
 
 class NodeShape(Enum):
@@ -53,86 +79,284 @@ class Border(Enum):
     BOTTOM = 3
 
 
-class Point:
+ARROW_LENGTH = 8
+LABEL_OUTLINE_WIDTH = 14
+
+
+# Glyph advances of printable ascii characters (32 to 126) in 1/1000 em, from Helvetica font metrics
+# (Arial has the same advances), used to estimate text widths without rendering them
+FONT_ADVANCES = {
+    ("Arial", "normal"): (
+        "278 278 355 556 556 889 667 191 333 333 389 584 278 333 278 278 556 556 556 556 556 556 556 556 556 556 "
+        "278 278 584 584 584 556 1015 667 667 722 722 667 611 778 722 278 500 667 556 833 722 778 667 778 722 667 "
+        "611 722 667 944 667 667 611 278 278 278 469 556 333 556 556 500 556 556 278 556 556 222 222 500 222 833 "
+        "556 556 556 556 333 500 278 556 500 722 500 500 500 334 260 334 584"),
+    ("Arial", "bold"): (
+        "278 333 474 556 556 889 722 238 333 333 389 584 278 333 278 278 556 556 556 556 556 556 556 556 556 556 "
+        "333 333 584 584 584 611 975 722 722 722 722 667 611 778 722 278 556 722 611 833 722 778 667 778 722 667 "
+        "611 722 667 944 667 667 611 333 278 333 584 556 333 556 611 556 611 556 333 611 611 278 278 556 278 889 "
+        "611 611 611 611 389 556 333 611 556 778 556 556 500 389 280 389 584"),
+}
+# Advance of characters missing from the tables, wide (east asian) characters are 1 em
+DEFAULT_ADVANCE = 556
+WIDE_ADVANCE = 1000
+
+
+# Add the glyph advances (dict of character -> advance in 1/1000 em) of a font used by measureText
+def registerFont(font_family, advances, font_weight="normal"):
+    FONT_ADVANCES[(font_family, font_weight)] = dict(advances)
+    getGlyphAdvances.cache_clear()
+    measureText.cache_clear()
+
+
+# Glyph advances tables are parsed once per font, unknown fonts use Arial advances
+@lru_cache(maxsize=None)
+def getGlyphAdvances(font_family, font_weight):
+    advances = FONT_ADVANCES.get((font_family, font_weight))
+    if advances is None:
+        advances = FONT_ADVANCES[("Arial", "bold" if font_weight == "bold" else "normal")]
+    if isinstance(advances, str):
+        advances = {chr(32 + i): int(advance) for i, advance in enumerate(advances.split())}
+        advances["\u00a0"] = advances[" "]
+    return advances
+
+
+# Return the estimated width of text in pixels, memoized since charts repeat the same labels
+@lru_cache(maxsize=2**16)
+def measureText(text, font_size, font_family="Arial", font_weight="normal"):
+    advances = getGlyphAdvances(font_family, font_weight)
+    total = 0
+    for character in text:
+        advance = advances.get(character)
+        if advance is None:
+            advance = WIDE_ADVANCE if unicodedata.east_asian_width(character) in ("W", "F") else DEFAULT_ADVANCE
+        total += advance
+    return total * font_size / 1000
+
+
+class ChartElement:
+    # Base class of chart elements, their englobing rect is cached in the chart until the chart geometry changes
+    # (see Chart.invalidateGeometry), so nested clusters do not compute the same children rects again
+    # Their rendered svg fragment is also cached in the chart until the element itself or the chart geometry
+    # changes, with the render options (markers, css, precision) of the export which rendered it
+    # (a moved node only drops the caches of its own edges and clusters, see Chart.invalidateNodeGeometry)
+    # Caches are kept out of elements, so they can be released at once (see Chart.releaseCaches)
+    # Elements use __slots__ to keep memory low on charts with millions of elements
+    # Constructors set attributes with object.__setattr__ : a new element has no cached fragment yet,
+    # and the chart geometry is invalidated once when the element is added to the chart
+    __slots__ = ("chart",)
+    geometry_attributes = ()
+    # Attributes changing the geometry only when chart.auto_size is set (text widths)
+    size_attributes = ()
+
+    def __init__(self, chart):
+        object.__setattr__(self, "chart", chart)
+
+    def __setstate__(self, state):
+        # Restore pickled attributes without invalidating the chart geometry
+        (dict_state, slots_state) = state
+        for name, value in slots_state.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        # The element is modified, its svg fragment must be rendered again
+        self.chart.fragments.pop(self, None)
+        if name in self.geometry_attributes or (name in self.size_attributes and self.chart.auto_size):
+            self.chart.invalidateGeometry()
+
+    def getRect(self):
+        rects = self.chart.rects
+        rect = rects.get(self)
+        if rect is None:
+            rect = rects[self] = self.computeRect()
+        return rect
+
+    def getSvgFragment(self, renderer):
+        key = (self.chart.geometry_version, renderer.fragment_options)
+        fragment = self.chart.fragments.get(self)
+        if fragment is None or fragment[0] != key:
+            buffer = io.StringIO()
+            self.draw(SvgStreamRenderer(buffer, renderer.marker_ids, renderer.style_classes, renderer.precision))
+            # (key, svg) set at once, so an export never reads the svg of another key
+            fragment = (key, buffer.getvalue())
+            self.chart.fragments[self] = fragment
+        return fragment[1]
+
+
+class Point(ChartElement):
     # Point is a pseudo node allowing to define the edge curve
     # It's treated as a node but does not draw anything
     # it can also be used to enlarge the chart englobing rect
 
+    __slots__ = ("col", "row", "text")
+    geometry_attributes = ("col", "row")
+
     def __init__(self, chart, col, row):
-        self.col = col
-        self.row = row
-        self.chart = chart
-        self.text = F"Point {col,row}"
+        super().__init__(chart)
+        initialize = object.__setattr__
+        initialize(self, "col", col)
+        initialize(self, "row", row)
+        initialize(self, "text", F"Point {col,row}")
         chart.addPoint(self)
-        print(F"New point '{self.text}'")
+        logger.debug("New point '%s'", self.text)
 
     def addEdge(self, border, angle, edge):
         pass
 
+    def isPositioned(self):
+        return True
+
     def getBorderCenter(self, border):
         return (self.col * self.chart.horizontal_step, self.row * self.chart.vertical_step)
 
     def getEdgePointOnBorder(self, border, edge):
         return (self.col * self.chart.horizontal_step, self.row * self.chart.vertical_step)
 
-    def getRect(self):
+    def computeRect(self):
         return Rect((self.col * self.chart.horizontal_step),
                     (self.col * self.chart.horizontal_step),
                     (self.row * self.chart.vertical_step),
                     (self.row * self.chart.vertical_step))
 
 
-class Node:
+class Node(ChartElement):
+    __slots__ = ("col", "row", "text", "color", "shape", "edges", "edge_slots")
+    geometry_attributes = ("col", "row", "shape")
+    size_attributes = ("text",)
+
     def __init__(self, chart, col, row, text="", color="white", shape=NodeShape.RECTANGLE):
-        self.col = col
-        self.row = row
-        self.text = text
-        self.color = color
-        self.shape = shape
-        self.edges = {Border.LEFT: [], Border.TOP: [], Border.RIGHT: [], Border.BOTTOM: []}
-
-        self.chart = chart
+        super().__init__(chart)
+        initialize = object.__setattr__
+        initialize(self, "col", col)
+        initialize(self, "row", row)
+        initialize(self, "text", text)
+        initialize(self, "color", color)
+        initialize(self, "shape", shape)
+        # (border_order, edge) list of each border, only borders with edges are present
+        # None until the first edge, most nodes of large charts have a few edges or none
+        initialize(self, "edges", None)
+        # Edge -> slot index on borders with several edges, absent when the border edges must be sorted again
+        # None until slots are needed
+        initialize(self, "edge_slots", None)
+
         chart.addNode(self)
-        print(F"New node '{text}'")
+        logger.debug("New node '%s'", text)
 
-    def addEdge(self, border, border_order, edge):
-        if border_order is None:
-            border_order = self.getEdgeCount(border)
+    def __setattr__(self, name, value):
+        if not (name in self.geometry_attributes or (name in self.size_attributes and self.chart.auto_size)):
+            super().__setattr__(name, value)
+            return
+        positioned = self.isPositioned()
+        object.__setattr__(self, name, value)
+        if positioned and self.isPositioned():
+            # Moved or resized : only the caches of this node, its edges and its clusters are updated
+            self.chart.invalidateNodeGeometry(self)
+            return
+        if positioned != self.isPositioned():
+            # Nodes without position are counted by the chart, so exports do not check all nodes
+            self.chart.unpositioned_node_count += 1 if positioned else -1
+        self.chart.fragments.pop(self, None)
+        self.chart.invalidateGeometry()
+
+    # Nodes created with None col and row are positioned by Chart.layoutNodes
+    def isPositioned(self):
+        return self.col is not None and self.row is not None
 
-        self.edges[border].append((border_order, edge))
+    # The caller invalidates the chart geometry, once for all the edges it adds
+    def addEdge(self, border, border_order, edge):
+        if self.edges is None:
+            object.__setattr__(self, "edges", {})
+        edges = self.edges.get(border)
+        if edges is None:
+            edges = self.edges[border] = []
+        edges.append((len(edges) if border_order is None else border_order, edge))
 
-        # Sort edges by border_order
-        self.edges[border] = sorted(self.edges[border], key=lambda x: x[0])
+        # Slots are updated lazily, so adding many edges to the same border does not sort it each time
+        if self.edge_slots is not None:
+            self.edge_slots.pop(border, None)
 
     def getEdgeCount(self, border):
-        return len(self.edges[border])
+        return len(self.edges.get(border, ())) if self.edges is not None else 0
+
+    def getEdgeSlots(self, border):
+        if self.edge_slots is None:
+            object.__setattr__(self, "edge_slots", {})
+        slots = self.edge_slots.get(border)
+        if slots is None:
+            # Sort edges by border_order (stable sort keeps creation order for equal values)
+            self.edges[border].sort(key=lambda x: x[0])
+            slots = {}
+            for i, order_and_edge in enumerate(self.edges[border]):
+                # A self-loop appears twice on its border, keep the index of its first end
+                slots.setdefault(order_and_edge[1], i)
+            self.edge_slots[border] = slots
+        return slots
 
     def getEdgeIndex(self, border, edge):
-        for i, order_and_edge in enumerate(self.edges[border]):
-            if order_and_edge[1] == edge:
-                return i
-        return None
+        edges = self.edges.get(border, ()) if self.edges is not None else ()
+        if len(edges) <= 1:
+            # No need to index a border with a single edge
+            return 0 if len(edges) == 1 and edges[0][1] is edge else None
+        return self.getEdgeSlots(border).get(edge)
+
+    # Replace the border orders of edges by the direction of their other end : from left to right on top
+    # and bottom borders, from top to bottom on left and right borders, so edges do not cross near the node
+    def orderEdgesByDirection(self):
+        if self.edges is None:
+            return
+        for border, orders_and_edges in self.edges.items():
+            if len(orders_and_edges) <= 1:
+                continue
+            (x, y) = self.getBorderCenter(border)
+            directions = []
+            for (order, edge) in orders_and_edges:
+                if edge.node_a is self and edge.node_a_border == border:
+                    (far_x, far_y) = edge.node_b.getBorderCenter(edge.node_b_border)
+                else:
+                    (far_x, far_y) = edge.node_a.getBorderCenter(edge.node_a_border)
+                directions.append((getBorderAngle(border, far_x - x, far_y - y), edge))
+            # Stable sort keeps the previous order of edges going in the same direction
+            directions.sort(key=lambda x: x[0])
+            self.edges[border] = [(i, edge) for i, (angle, edge) in enumerate(directions)]
+        object.__setattr__(self, "edge_slots", None)
+
+    # Return the estimated width of the node text (see measureText)
+    def getTextWidth(self):
+        return measureText(self.text, self.chart.font_size)
+
+    # chart.node_width, or the text width with margins if larger and chart.auto_size is set
+    def getWidth(self):
+        if not self.chart.auto_size or self.shape == NodeShape.DIAMOND or self.text == "":
+            return self.chart.node_width
+        margin = self.chart.font_size
+        if self.shape == NodeShape.ROUNDED_RECTANGLE:
+            margin = margin + self.chart.node_height / 2
+        return max(self.chart.node_width, self.getTextWidth() + margin)
+
+    def getHeight(self):
+        return self.chart.node_height
 
     def getBorderCenter(self, border):
         if border == Border.LEFT:
             return (self.col * self.chart.horizontal_step -
-                    self.chart.node_width / 2, self.row * self.chart.vertical_step)
+                    self.getWidth() / 2, self.row * self.chart.vertical_step)
         if border == Border.TOP:
             return (self.col * self.chart.horizontal_step, self.row *
-                    self.chart.vertical_step - self.chart.node_height / 2)
+                    self.chart.vertical_step - self.getHeight() / 2)
         if border == Border.RIGHT:
             return (self.col * self.chart.horizontal_step +
-                    self.chart.node_width / 2, self.row * self.chart.vertical_step)
+                    self.getWidth() / 2, self.row * self.chart.vertical_step)
         if border == Border.BOTTOM:
             return (self.col * self.chart.horizontal_step, self.row *
-                    self.chart.vertical_step + self.chart.node_height / 2)
+                    self.chart.vertical_step + self.getHeight() / 2)
 
     def getEdgePointOnBorder(self, border, edge):
 
         if self.shape == NodeShape.DIAMOND:
             xc = self.col * self.chart.horizontal_step
             yc = self.row * self.chart.vertical_step
-            c = self.chart.node_height / 2
+            c = self.getHeight() / 2
             if border == Border.LEFT:
                 return (xc - c, yc)
             if border == Border.TOP:
@@ -144,63 +368,71 @@ class Node:
 
         (x, y) = self.getBorderCenter(border)
         if border == Border.LEFT or border == Border.RIGHT:
-            y = y + self.chart.node_height * (self.getEdgeIndex(border, edge) + 1) / \
-                (self.getEdgeCount(border) + 1) - self.chart.node_height / 2
+            height = self.getHeight()
+            y = y + height * (self.getEdgeIndex(border, edge) + 1) / (self.getEdgeCount(border) + 1) - height / 2
         else:
-            x = x + self.chart.node_width * (self.getEdgeIndex(border, edge) + 1) / \
-                (self.getEdgeCount(border) + 1) - self.chart.node_width / 2
+            width = self.getWidth()
+            x = x + width * (self.getEdgeIndex(border, edge) + 1) / (self.getEdgeCount(border) + 1) - width / 2
 
         return (x, y)
 
-    def getRect(self):
-        return Rect((self.col * self.chart.horizontal_step) - self.chart.node_width / 2,
-                    (self.col * self.chart.horizontal_step) + self.chart.node_width / 2,
-                    (self.row * self.chart.vertical_step) - self.chart.node_height / 2,
-                    (self.row * self.chart.vertical_step) + self.chart.node_height / 2)
+    def computeRect(self):
+        width = self.getWidth()
+        return Rect((self.col * self.chart.horizontal_step) - width / 2,
+                    (self.col * self.chart.horizontal_step) + width / 2,
+                    (self.row * self.chart.vertical_step) - self.getHeight() / 2,
+                    (self.row * self.chart.vertical_step) + self.getHeight() / 2)
 
     def draw(self, drawing):
         if self.shape == NodeShape.DIAMOND:
             xc = self.col * self.chart.horizontal_step
             yc = self.row * self.chart.vertical_step
-            c = self.chart.node_height / 2
+            c = self.getHeight() / 2
 
             # Connect the vertices to form a diamond shape
-            drawing.append(draw.Lines(xc - c,
-                                      yc,
-                                      xc,
-                                      yc - c,
-                                      xc + c,
-                                      yc,
-                                      xc,
-                                      yc + c,
-                                      close=True,
-                                      fill=self.color,
-                                      stroke='black',
-                                      stroke_width=2))
+            path = PathData().M(xc - c, yc).L(xc, yc - c).L(xc + c, yc).L(xc, yc + c).Z()
+            drawing.path(path,
+                         fill=self.color,
+                         stroke='black',
+                         stroke_width=2)
 
         else:
             rx = self.chart.node_height / 2 if self.shape == NodeShape.ROUNDED_RECTANGLE else 0
             rect = self.getRect()
-            drawing.append(draw.Rectangle(rect.min_x,
-                                          rect.min_y,
-                                          rect.getWidth(),
-                                          rect.getHeight(),
-                                          fill=self.color,
-                                          stroke='black',
-                                          stroke_width=2,
-                                          rx=rx))
+            drawing.rectangle(rect.min_x,
+                              rect.min_y,
+                              rect.getWidth(),
+                              rect.getHeight(),
+                              fill=self.color,
+                              stroke='black',
+                              stroke_width=2,
+                              rx=rx)
 
         if self.text != "":
-            drawing.append(draw.Text(self.text,
-                                     self.chart.font_size,
-                                     self.col * self.chart.horizontal_step,
-                                     self.row * self.chart.vertical_step,
-                                     text_anchor='middle',
-                                     dominant_baseline='middle',
-                                     font_family='Arial'))
+            drawing.text(self.text,
+                         self.chart.font_size,
+                         self.col * self.chart.horizontal_step,
+                         self.row * self.chart.vertical_step,
+                         text_anchor='middle',
+                         dominant_baseline='middle',
+                         font_family='Arial')
+
+
+# Return the angle of the (dx, dy) direction from the outward normal of border, in [-pi, pi]
+# Angles increase from left to right on top and bottom borders, from top to bottom on left and right borders
+def getBorderAngle(border, dx, dy):
+    if border == Border.TOP:
+        return math.atan2(dx, -dy)
+    if border == Border.BOTTOM:
+        return math.atan2(dx, dy)
+    if border == Border.LEFT:
+        return math.atan2(dy, -dx)
+    return math.atan2(dy, dx)
 
 
 # edge_string format : [<]-[-][>]
+# Charts use a few distinct edge strings, so parsed results are cached
+@lru_cache(maxsize=None)
 def parseEdgeString(edge_string):
     node_a_arrow = edge_string.startswith("<")
     node_b_arrow = edge_string.endswith(">")
@@ -209,7 +441,11 @@ def parseEdgeString(edge_string):
     return (dashed, node_a_arrow, node_b_arrow)
 
 
-class Edge:
+class Edge(ChartElement):
+    __slots__ = ("dashed", "node_a", "node_b", "node_a_arrow", "node_b_arrow", "text", "color", "layout",
+                 "node_a_border", "node_b_border")
+    size_attributes = ("text",)
+
     # border_order allow to set the ordering of different edges connected to the same node border
     # lower values will be on left/top, higher values will be on right/bottom
     # if border_order is None, then the edge creation order is used
@@ -217,62 +453,86 @@ class Edge:
                  node_a_border_order=None, node_b_border_order=None):
         assert (node_a is not None)
         assert (node_b is not None)
-        (self.dashed, node_a_arrow, node_b_arrow) = parseEdgeString(edge_string)
-        self.node_a = node_a
-        self.node_b = node_b
-        self.node_a_arrow = node_a_arrow
-        self.node_b_arrow = node_b_arrow
-        self.text = text
-        self.color = color
+        super().__init__(chart)
+        (dashed, node_a_arrow, node_b_arrow) = parseEdgeString(edge_string)
+        initialize = object.__setattr__
+        initialize(self, "dashed", dashed)
+        initialize(self, "node_a", node_a)
+        initialize(self, "node_b", node_b)
+        initialize(self, "node_a_arrow", node_a_arrow)
+        initialize(self, "node_b_arrow", node_b_arrow)
+        initialize(self, "text", text)
+        initialize(self, "color", color)
+        initialize(self, "layout", layout)
+        initialize(self, "node_a_border", None)
+        initialize(self, "node_b_border", None)
+
+        if node_a.isPositioned() and node_b.isPositioned():
+            self.resolveBorders(node_a_border_order, node_b_border_order)
+        else:
+            # Borders depend on node positions, they are resolved once nodes are positioned by Chart.layoutNodes
+            chart.addPendingEdge(self, node_a_border_order, node_b_border_order)
+
+        chart.addEdge(self)
+        logger.debug("New edge '%s' : '%s' '%s' '%s'", text, node_a.text, edge_string, node_b.text)
+
+    # Choose the node borders from the layout and node positions, and add the edge to these borders
+    # Called for new edges, which have no cached fragment, and the caller invalidates the chart geometry
+    def resolveBorders(self, node_a_border_order, node_b_border_order):
+        (node_a, node_b, layout) = (self.node_a, self.node_b, self.layout)
         if layout == EdgeLayout.AUTO:
             # TOP_BOTTOM_CURVED by default, fallback to LEFT_RIGHT_CURVED only if nodes are on the same row
             if node_a.row == node_b.row:
                 layout = EdgeLayout.LEFT_RIGHT_STRAIGHT
             else:
                 layout = EdgeLayout.TOP_BOTTOM_STRAIGHT
-        self.layout = layout
 
         if layout == EdgeLayout.LEFT_RIGHT_STRAIGHT or layout == EdgeLayout.LEFT_RIGHT_CURVED:
             if node_a.getBorderCenter(Border.RIGHT)[0] < node_b.getBorderCenter(Border.LEFT)[0]:
-                self.node_a_border = Border.RIGHT
-                self.node_b_border = Border.LEFT
+                node_a_border = Border.RIGHT
+                node_b_border = Border.LEFT
             elif node_b.getBorderCenter(Border.RIGHT)[0] < node_a.getBorderCenter(Border.LEFT)[0]:
-                self.node_a_border = Border.LEFT
-                self.node_b_border = Border.RIGHT
+                node_a_border = Border.LEFT
+                node_b_border = Border.RIGHT
             else:
                 assert (False)
         elif layout == EdgeLayout.LEFT_LEFT_CURVED:
-            self.node_a_border = Border.LEFT
-            self.node_b_border = Border.LEFT
+            node_a_border = Border.LEFT
+            node_b_border = Border.LEFT
         elif layout == EdgeLayout.RIGHT_RIGHT_CURVED:
-            self.node_a_border = Border.RIGHT
-            self.node_b_border = Border.RIGHT
+            node_a_border = Border.RIGHT
+            node_b_border = Border.RIGHT
         elif layout == EdgeLayout.TOP_BOTTOM_STRAIGHT or layout == EdgeLayout.TOP_BOTTOM_CURVED:
             if node_a.getBorderCenter(Border.BOTTOM)[1] < node_b.getBorderCenter(Border.TOP)[1]:
-                self.node_a_border = Border.BOTTOM
-                self.node_b_border = Border.TOP
+                node_a_border = Border.BOTTOM
+                node_b_border = Border.TOP
             elif node_b.getBorderCenter(Border.BOTTOM)[1] < node_a.getBorderCenter(Border.TOP)[1]:
-                self.node_a_border = Border.TOP
-                self.node_b_border = Border.BOTTOM
+                node_a_border = Border.TOP
+                node_b_border = Border.BOTTOM
             else:
                 assert (False)
         elif layout == EdgeLayout.TOP_TOP_CURVED:
-            self.node_a_border = Border.TOP
-            self.node_b_border = Border.TOP
+            node_a_border = Border.TOP
+            node_b_border = Border.TOP
         elif layout == EdgeLayout.BOTTOM_BOTTOM_CURVED:
-            self.node_a_border = Border.BOTTOM
-            self.node_b_border = Border.BOTTOM
-
-        node_a.addEdge(self.node_a_border, node_a_border_order, self)
-        node_b.addEdge(self.node_b_border, node_b_border_order, self)
-
-        self.chart = chart
-        chart.addEdge(self)
-        print(F"New edge '{text}' : '{node_a.text}' '{edge_string}' '{node_b.text}'")
-
-    def getCenter(self):
-        (xa, ya) = self.node_a.getEdgePointOnBorder(self.node_a_border, self)
-        (xb, yb) = self.node_b.getEdgePointOnBorder(self.node_b_border, self)
+            node_a_border = Border.BOTTOM
+            node_b_border = Border.BOTTOM
+
+        initialize = object.__setattr__
+        initialize(self, "layout", layout)
+        initialize(self, "node_a_border", node_a_border)
+        initialize(self, "node_b_border", node_b_border)
+        node_a.addEdge(node_a_border, node_a_border_order, self)
+        node_b.addEdge(node_b_border, node_b_border_order, self)
+
+    # Return the edge points on node_a and node_b borders
+    def getAnchors(self):
+        return (self.node_a.getEdgePointOnBorder(self.node_a_border, self),
+                self.node_b.getEdgePointOnBorder(self.node_b_border, self))
+
+    # anchors can be passed to avoid computing them again
+    def getCenter(self, anchors=None):
+        ((xa, ya), (xb, yb)) = anchors or self.getAnchors()
         (xc, yc) = ((xa + xb) / 2, (ya + yb) / 2)
 
         if self.layout == EdgeLayout.LEFT_LEFT_CURVED:
@@ -286,89 +546,183 @@ class Edge:
 
         return (xc, yc)
 
-    def getRect(self):
-        (xa, ya) = self.node_a.getEdgePointOnBorder(self.node_a_border, self)
-        (xb, yb) = self.node_b.getEdgePointOnBorder(self.node_b_border, self)
-        (xc, yc) = self.getCenter()
-        return Rect(min(xa, xb, xc), max(xa, xb, xc), min(ya, yb, yc), max(ya, yb, yc))
+    # Return (xa, ya, xb, yb, xc, yc) : anchors on node borders and center, read from the geometry
+    # computed for all chart edges at once (see Chart.getEdgeGeometry)
+    def getGeometry(self):
+        geometry = self.chart.getEdgeGeometry().get(self)
+        if geometry is None:
+            # Edge not added to the chart yet
+            ((xa, ya), (xb, yb)) = anchors = self.getAnchors()
+            geometry = (xa, ya, xb, yb, *self.getCenter(anchors))
+        return geometry
+
+    def computeRect(self):
+        (xa, ya, xb, yb, xc, yc) = self.getGeometry()
+        rect = Rect(min(xa, xb, xc), max(xa, xb, xc), min(ya, yb, yc), max(ya, yb, yc))
+        if self.chart.auto_size and self.text != "":
+            # Label box, with the white outline drawn around the text
+            half_width = measureText(self.text, self.chart.font_size) / 2 + LABEL_OUTLINE_WIDTH / 2
+            half_height = self.chart.font_size / 2 + LABEL_OUTLINE_WIDTH / 2
+            rect.englobe(Rect(xc - half_width, xc + half_width, yc - half_height, yc + half_height))
+        return rect
+
+    def hasArrow(self):
+        return self.node_a_arrow or self.node_b_arrow
+
+    def getStrokeWidth(self):
+        return 2
+
+    # Return the edge string giving this edge dashes and arrows
+    def getEdgeString(self):
+        return ("<" if self.node_a_arrow else "") + ("--" if self.dashed else "-") + (">" if self.node_b_arrow else "")
 
     def draw(self, drawing):
-        arrow_length = 8
-        arrow = draw.Marker(-arrow_length, -5, 2, 5, orient='auto-start-reverse')
-        arrow.append(draw.Lines(-arrow_length, 3, -arrow_length, -3, 2, 0, fill=self.color, close=True))
-
-        path = draw.Path(stroke=self.color,
-                         stroke_width=2,
-                         stroke_dasharray="7,4" if self.dashed else None,
-                         fill='none',
-                         marker_start=arrow if self.node_a_arrow else None,
-                         marker_end=arrow if self.node_b_arrow else None)
-
-        (xa, ya) = self.node_a.getEdgePointOnBorder(self.node_a_border, self)
-        (xb, yb) = self.node_b.getEdgePointOnBorder(self.node_b_border, self)
-        (xc, yc) = self.getCenter()
-        if self.layout == EdgeLayout.TOP_BOTTOM_STRAIGHT or self.layout == EdgeLayout.LEFT_RIGHT_STRAIGHT:
-            path = path.M(xa, ya).L(xb, yb)
-        elif self.layout == EdgeLayout.LEFT_LEFT_CURVED:
-            x_arrow = min(xa, xb) - arrow_length
-            path = path.M(xa, ya).L(x_arrow, ya).Q(xc, ya, xc, yc).Q(xc, yb, x_arrow, yb).L(xb, yb)
-        elif self.layout == EdgeLayout.LEFT_RIGHT_CURVED:
-            xa_arrow = xa + arrow_length if xa < xb else xa - arrow_length
-            xb_arrow = xb - arrow_length if xa < xb else xb + arrow_length
-            path = path.M(xa, ya).L(xa_arrow, ya).Q(xc, ya, xc, yc).Q(xc, yb, xb_arrow, yb).L(xb, yb)
-        elif self.layout == EdgeLayout.RIGHT_RIGHT_CURVED:
-            x_arrow = max(xa, xb) + arrow_length
-            path = path.M(xa, ya).L(x_arrow, ya).Q(xc, ya, xc, yc).Q(xc, yb, x_arrow, yb).L(xb, yb)
-        elif self.layout == EdgeLayout.TOP_TOP_CURVED:
-            y_arrow = min(ya, yb) - arrow_length
-            path = path.M(xa, ya).L(xa, y_arrow).Q(xa, yc, xc, yc).Q(xb, yc, xb, y_arrow).L(xb, yb)
-        elif self.layout == EdgeLayout.TOP_BOTTOM_CURVED:
-            ya_arrow = ya + arrow_length if ya < yb else ya - arrow_length
-            yb_arrow = yb - arrow_length if ya < yb else yb + arrow_length
-            path = path.M(xa, ya).L(xa, ya_arrow).Q(xa, yc, xc, yc).Q(xb, yc, xb, yb_arrow).L(xb, yb)
-        elif self.layout == EdgeLayout.BOTTOM_BOTTOM_CURVED:
-            y_arrow = max(ya, yb) + arrow_length
-            path = path.M(xa, ya).L(xa, y_arrow).Q(xa, yc, xc, yc).Q(xb, yc, xb, y_arrow).L(xb, yb)
-
-        drawing.append(path)
+        (xa, ya, xb, yb, xc, yc) = self.getGeometry()
+        path = EDGE_PATHS[self.layout](xa, ya, xb, yb, xc, yc)
+
+        arrow = drawing.arrowMarker(self) if self.hasArrow() else None
+        drawing.path(path,
+                     stroke=self.color,
+                     stroke_width=self.getStrokeWidth(),
+                     stroke_dasharray="7,4" if self.dashed else None,
+                     fill='none',
+                     marker_start=arrow if self.node_a_arrow else None,
+                     marker_end=arrow if self.node_b_arrow else None)
 
         if self.text == "":
             return
 
-        drawing.append(draw.Text(self.text,
-                                 self.chart.font_size,
-                                 xc,
-                                 yc,
-                                 text_anchor='middle',
-                                 dominant_baseline='middle',
-                                 font_family='Arial',
-                                 fill='white',
-                                 stroke='white',
-                                 stroke_width=14,
-                                 stroke_miterlimit=1))
-        drawing.append(draw.Text(self.text,
-                                 self.chart.font_size,
-                                 xc,
-                                 yc,
-                                 text_anchor='middle',
-                                 dominant_baseline='middle',
-                                 font_family='Arial',
-                                 fill=self.color))
-
-
-class Cluster:
+        drawing.text(self.text,
+                     self.chart.font_size,
+                     xc,
+                     yc,
+                     text_anchor='middle',
+                     dominant_baseline='middle',
+                     font_family='Arial',
+                     fill='white',
+                     stroke='white',
+                     stroke_width=LABEL_OUTLINE_WIDTH,
+                     stroke_miterlimit=1)
+        drawing.text(self.text,
+                     self.chart.font_size,
+                     xc,
+                     yc,
+                     text_anchor='middle',
+                     dominant_baseline='middle',
+                     font_family='Arial',
+                     fill=self.color)
+
+
+class ClusterSummary(Node):
+    # Box replacing a collapsed cluster and its content in a level of detail chart (see Chart.getLevelOfDetailChart)
+    # It has the size of the cluster, so other elements do not move, and edges are connected to its borders
+
+    __slots__ = ("width", "height")
+
+    def __init__(self, chart, rect, text="", color="white", rounded=False):
+        object.__setattr__(self, "width", rect.getWidth())
+        object.__setattr__(self, "height", rect.getHeight())
+        super().__init__(chart, (rect.min_x + rect.max_x) / 2 / chart.horizontal_step,
+                         (rect.min_y + rect.max_y) / 2 / chart.vertical_step, text, color,
+                         NodeShape.ROUNDED_RECTANGLE if rounded else NodeShape.RECTANGLE)
+
+    def getWidth(self):
+        return self.width
+
+    def getHeight(self):
+        return self.height
+
+
+class AggregatedEdge(Edge):
+    # Single edge replacing the edges between two collapsed clusters (or a collapsed cluster and a node)
+    # in a level of detail chart, weight is the number of replaced edges, shown by the edge width
+
+    __slots__ = ("weight",)
+
+    def __init__(self, chart, node_a, node_b, weight, text="", color="black"):
+        object.__setattr__(self, "weight", weight)
+        # Straight edge between boxes separated vertically or horizontally, curved above them otherwise
+        (rect_a, rect_b) = (node_a.getRect(), node_b.getRect())
+        if rect_a.max_y < rect_b.min_y or rect_b.max_y < rect_a.min_y:
+            layout = EdgeLayout.TOP_BOTTOM_STRAIGHT
+        elif rect_a.max_x < rect_b.min_x or rect_b.max_x < rect_a.min_x:
+            layout = EdgeLayout.LEFT_RIGHT_STRAIGHT
+        else:
+            layout = EdgeLayout.TOP_TOP_CURVED
+        super().__init__(chart, node_a, node_b, "-", text, color, layout)
+
+    def getStrokeWidth(self):
+        return min(2 + 2 * math.log2(self.weight), 12)
+
+
+# Edge path from anchors (xa, ya), (xb, yb) and center (xc, yc), for each layout
+# Curved edges start and end with a straight segment of ARROW_LENGTH so arrows are aligned with node borders
+
+def getStraightPath(xa, ya, xb, yb, xc, yc):
+    return PathData().M(xa, ya).L(xb, yb)
+
+
+def getLeftLeftPath(xa, ya, xb, yb, xc, yc):
+    x_arrow = min(xa, xb) - ARROW_LENGTH
+    return PathData().M(xa, ya).L(x_arrow, ya).Q(xc, ya, xc, yc).Q(xc, yb, x_arrow, yb).L(xb, yb)
+
+
+def getLeftRightPath(xa, ya, xb, yb, xc, yc):
+    xa_arrow = xa + ARROW_LENGTH if xa < xb else xa - ARROW_LENGTH
+    xb_arrow = xb - ARROW_LENGTH if xa < xb else xb + ARROW_LENGTH
+    return PathData().M(xa, ya).L(xa_arrow, ya).Q(xc, ya, xc, yc).Q(xc, yb, xb_arrow, yb).L(xb, yb)
+
+
+def getRightRightPath(xa, ya, xb, yb, xc, yc):
+    x_arrow = max(xa, xb) + ARROW_LENGTH
+    return PathData().M(xa, ya).L(x_arrow, ya).Q(xc, ya, xc, yc).Q(xc, yb, x_arrow, yb).L(xb, yb)
+
+
+def getTopTopPath(xa, ya, xb, yb, xc, yc):
+    y_arrow = min(ya, yb) - ARROW_LENGTH
+    return PathData().M(xa, ya).L(xa, y_arrow).Q(xa, yc, xc, yc).Q(xb, yc, xb, y_arrow).L(xb, yb)
+
+
+def getTopBottomPath(xa, ya, xb, yb, xc, yc):
+    ya_arrow = ya + ARROW_LENGTH if ya < yb else ya - ARROW_LENGTH
+    yb_arrow = yb - ARROW_LENGTH if ya < yb else yb + ARROW_LENGTH
+    return PathData().M(xa, ya).L(xa, ya_arrow).Q(xa, yc, xc, yc).Q(xb, yc, xb, yb_arrow).L(xb, yb)
+
+
+def getBottomBottomPath(xa, ya, xb, yb, xc, yc):
+    y_arrow = max(ya, yb) + ARROW_LENGTH
+    return PathData().M(xa, ya).L(xa, y_arrow).Q(xa, yc, xc, yc).Q(xb, yc, xb, y_arrow).L(xb, yb)
+
+
+EDGE_PATHS = {
+    EdgeLayout.TOP_BOTTOM_STRAIGHT: getStraightPath,
+    EdgeLayout.LEFT_RIGHT_STRAIGHT: getStraightPath,
+    EdgeLayout.TOP_BOTTOM_CURVED: getTopBottomPath,
+    EdgeLayout.TOP_TOP_CURVED: getTopTopPath,
+    EdgeLayout.BOTTOM_BOTTOM_CURVED: getBottomBottomPath,
+    EdgeLayout.LEFT_RIGHT_CURVED: getLeftRightPath,
+    EdgeLayout.RIGHT_RIGHT_CURVED: getRightRightPath,
+    EdgeLayout.LEFT_LEFT_CURVED: getLeftLeftPath,
+}
+
+
+class Cluster(ChartElement):
+    __slots__ = ("children", "text", "color", "rounded")
+    geometry_attributes = ("children", "text")
+
     def __init__(self, chart, children, text="", color="none", rounded=False):
         assert (len(children) > 0)
-        self.children = children
-        self.text = text
-        self.color = color
-        self.rounded = rounded
+        super().__init__(chart)
+        initialize = object.__setattr__
+        initialize(self, "children", children)
+        initialize(self, "text", text)
+        initialize(self, "color", color)
+        initialize(self, "rounded", rounded)
 
-        self.chart = chart
         chart.addCluster(self)
-        print(F"New cluster '{text}'")
+        logger.debug("New cluster '%s'", text)
 
-    def getRect(self):
+    def computeRect(self):
         englobing_rect = Rect(math.inf, -math.inf, math.inf, -math.inf)
         for child in self.children:
             englobing_rect.englobe(child.getRect())
@@ -383,26 +737,28 @@ class Cluster:
         englobing_rect = self.getRect()
 
         rx = self.chart.node_height / 2 if self.rounded else 0
-        drawing.append(draw.Rectangle(englobing_rect.min_x,
-                                      englobing_rect.min_y,
-                                      englobing_rect.getWidth(),
-                                      englobing_rect.getHeight(),
-                                      fill=self.color,
-                                      stroke='black',
-                                      stroke_width=2,
-                                      rx=rx))
-
-        drawing.append(draw.Text(self.text,
-                                 self.chart.font_size,
-                                 englobing_rect.min_x,
-                                 englobing_rect.min_y,
-                                 text_anchor='start',
-                                 dominant_baseline='text-after-edge',
-                                 font_family='Arial',
-                                 font_weight='bold'))
+        drawing.rectangle(englobing_rect.min_x,
+                          englobing_rect.min_y,
+                          englobing_rect.getWidth(),
+                          englobing_rect.getHeight(),
+                          fill=self.color,
+                          stroke='black',
+                          stroke_width=2,
+                          rx=rx)
+
+        drawing.text(self.text,
+                     self.chart.font_size,
+                     englobing_rect.min_x,
+                     englobing_rect.min_y,
+                     text_anchor='start',
+                     dominant_baseline='text-after-edge',
+                     font_family='Arial',
+                     font_weight='bold')
 
 
 class Rect:
+    __slots__ = ("min_x", "max_x", "min_y", "max_y")
+
     def __init__(self, min_x, max_x, min_y, max_y):
         self.min_x = min_x
         self.max_x = max_x
@@ -421,6 +777,10 @@ class Rect:
         self.min_y = min(self.min_y, other.min_y)
         self.max_y = max(self.max_y, other.max_y)
 
+    def intersects(self, other):
+        return (self.min_x <= other.max_x and other.min_x <= self.max_x and
+                self.min_y <= other.max_y and other.min_y <= self.max_y)
+
     def getWidth(self):
         return self.max_x - self.min_x
 
@@ -428,71 +788,1967 @@ class Rect:
         return self.max_y - self.min_y
 
 
+class SpatialIndex:
+    # Grids of cells referencing the elements whose rect intersects them,
+    # so elements in a given area are found without iterating all chart elements
+    # Each level has cells twice as large as the previous one, and elements are referenced in the first level
+    # where they cover at most max_element_cells cells : long edges and large clusters are found through a few
+    # large cells, instead of being referenced by many cells or tested by every query
+
+    max_element_cells = 16
+
+    def __init__(self, cell_width, cell_height):
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        # {(col, row): [(order, element), ...]} of each level
+        self.levels = []
+
+    def getCellRanges(self, rect, level):
+        (cell_width, cell_height) = (self.cell_width * 2**level, self.cell_height * 2**level)
+        return (range(math.floor(rect.min_x / cell_width), math.floor(rect.max_x / cell_width) + 1),
+                range(math.floor(rect.min_y / cell_height), math.floor(rect.max_y / cell_height) + 1))
+
+    # Return (cells, cols, rows) of the level where an element with rect is referenced
+    def getElementCells(self, rect):
+        (width, height) = ((rect.max_x - rect.min_x) / self.cell_width, (rect.max_y - rect.min_y) / self.cell_height)
+        # Skip the levels where rect is surely too large : it covers at least max(width, height) cells
+        # and width * height cells of level 0, divided by 2 and 4 at each level
+        level = max(0, math.ceil(max(math.log2(max(width, height, 1) / self.max_element_cells),
+                                     math.log2(max(width * height, 1) / self.max_element_cells) / 2)))
+        (cols, rows) = self.getCellRanges(rect, level)
+        while len(cols) * len(rows) > self.max_element_cells:
+            level += 1
+            (cols, rows) = self.getCellRanges(rect, level)
+        while len(self.levels) <= level:
+            self.levels.append({})
+        return (self.levels[level], cols, rows)
+
+    # order is used to return elements in drawing order
+    def insert(self, element, order):
+        (cells, cols, rows) = self.getElementCells(element.getRect())
+        entry = (order, element)
+        for col in cols:
+            for row in rows:
+                elements = cells.get((col, row))
+                if elements is None:
+                    cells[(col, row)] = [entry]
+                else:
+                    elements.append(entry)
+
+    # Remove an element inserted with rect, return its order
+    def remove(self, element, rect):
+        (cells, cols, rows) = self.getElementCells(rect)
+        for col in cols:
+            for row in rows:
+                elements = cells[(col, row)]
+                for i, (order, other) in enumerate(elements):
+                    if other is element:
+                        del elements[i]
+                        break
+                if len(elements) == 0:
+                    del cells[(col, row)]
+        return order
+
+    # Return the elements intersecting rect, in drawing order
+    def query(self, rect):
+        found = {}
+        for level, cells in enumerate(self.levels):
+            (cols, rows) = self.getCellRanges(rect, level)
+            if len(cols) * len(rows) > len(cells):
+                # Fewer non-empty cells than cells in rect (large viewports or coarse levels)
+                for (col, row), elements in cells.items():
+                    if col in cols and row in rows:
+                        found.update(elements)
+            else:
+                for col in cols:
+                    for row in rows:
+                        found.update(cells.get((col, row), ()))
+        return [element for order, element in sorted(found.items(), key=lambda x: x[0])
+                if element.getRect().intersects(rect)]
+
+
+class LayeredLayout:
+    # Layered (Sugiyama style) layout of nodes in grid rows : edges go down from node_a to node_b,
+    # cycles are broken by reversing edges, each node is put on the row below its lowest predecessor,
+    # then the order of nodes in each row is improved by sweeps sorting them by the barycenter of their
+    # neighbors, which quickly removes most edge crossings (without the cost of an exact method)
+    # All steps are linear in nodes + edges, except sorting rows in each sweep
+
+    def __init__(self, node_count, links):
+        # links are the (node_a, node_b) index pairs of the edges
+        self.node_count = node_count
+        self.successors = [[] for i in range(node_count)]
+        self.predecessors = [[] for i in range(node_count)]
+        for (a, b) in self.getAcyclicLinks(links):
+            self.successors[a].append(b)
+            self.predecessors[b].append(a)
+        self.layers = self.getLayers()
+        self.rows = []
+        self.width = 0
+        self.cols = [0] * node_count
+
+    # Return links where those closing a cycle (found by a depth first search) are reversed
+    def getAcyclicLinks(self, links):
+        successors = [[] for i in range(self.node_count)]
+        for (a, b) in links:
+            if a != b:
+                successors[a].append(b)
+        (NEW, ACTIVE, DONE) = (0, 1, 2)
+        states = [NEW] * self.node_count
+        acyclic_links = []
+        for root in range(self.node_count):
+            if states[root] != NEW:
+                continue
+            states[root] = ACTIVE
+            stack = [(root, iter(successors[root]))]
+            while stack:
+                (node, node_successors) = stack[-1]
+                successor = next(node_successors, None)
+                if successor is None:
+                    states[node] = DONE
+                    stack.pop()
+                elif states[successor] == ACTIVE:
+                    acyclic_links.append((successor, node))
+                else:
+                    acyclic_links.append((node, successor))
+                    if states[successor] == NEW:
+                        states[successor] = ACTIVE
+                        stack.append((successor, iter(successors[successor])))
+        return acyclic_links
+
+    # Return the layer of each node : longest path from sources, then sources are moved down
+    # just above their first successor, so they do not create long edges from the first layer
+    def getLayers(self):
+        predecessor_counts = [len(predecessors) for predecessors in self.predecessors]
+        order = [node for node in range(self.node_count) if predecessor_counts[node] == 0]
+        layers = [0] * self.node_count
+        for node in order:
+            for successor in self.successors[node]:
+                layers[successor] = max(layers[successor], layers[node] + 1)
+                predecessor_counts[successor] -= 1
+                if predecessor_counts[successor] == 0:
+                    order.append(successor)
+        for node in range(self.node_count):
+            if not self.predecessors[node] and self.successors[node]:
+                layers[node] = min(layers[successor] for successor in self.successors[node]) - 1
+        return layers
+
+    # Sort the nodes of each row by the mean col of their neighbors in previous rows (down sweeps)
+    # or next rows (up sweeps), until no row changes, max_iterations down and up sweeps or deadline
+    # (time.perf_counter value) is reached
+    # Return the number of sweeps done
+    def reduceCrossings(self, max_iterations, deadline=None):
+        self.rows = [[] for i in range(max(self.layers, default=-1) + 1)]
+        for node in range(self.node_count):
+            self.rows[self.layers[node]].append(node)
+        self.width = max((len(row) for row in self.rows), default=0)
+        for row in self.rows:
+            self.setCols(row)
+
+        sweep_count = 0
+        for iteration in range(max_iterations):
+            changed = False
+            for (rows, neighbors) in ((self.rows[1:], self.predecessors),
+                                      (self.rows[-2::-1], self.successors)):
+                for row in rows:
+                    changed = self.sortRow(row, neighbors) or changed
+                    if deadline is not None and time.perf_counter() > deadline:
+                        return sweep_count
+                sweep_count += 1
+            if not changed:
+                break
+        return sweep_count
+
+    # Sort row in place, return True if the order changed
+    def sortRow(self, row, neighbors):
+        cols = self.cols
+        barycenters = {}
+        for node in row:
+            node_neighbors = neighbors[node]
+            barycenters[node] = sum(cols[neighbor] for neighbor in node_neighbors) / len(node_neighbors) \
+                if node_neighbors else cols[node]
+        sorted_row = sorted(row, key=barycenters.__getitem__)
+        if sorted_row == row:
+            return False
+        row[:] = sorted_row
+        self.setCols(row)
+        return True
+
+    # Nodes of a row are on consecutive cols, rows are centered on the widest one
+    def setCols(self, row):
+        offset = (self.width - len(row)) / 2
+        if offset.is_integer():
+            offset = int(offset)
+        for i, node in enumerate(row):
+            self.cols[node] = offset + i
+
+
+# Same escaping as drawsvg text content
+def escapeText(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def roundNumber(value, precision):
+    # Round floats to precision digits, integral values are written without trailing '.0'
+    if precision is None or not isinstance(value, float):
+        return value
+    value = round(value, precision)
+    return int(value) if value.is_integer() else value
+
+
+class PathData:
+    # Svg path commands, formatted like drawsvg Path by default or compacted with a given precision
+
+    def __init__(self):
+        self.commands = []
+
+    def append(self, command, *args):
+        self.commands.append((command, args))
+        return self
+
+    def M(self, x, y):
+        return self.append("M", x, y)
+
+    def L(self, x, y):
+        return self.append("L", x, y)
+
+    def Q(self, cx, cy, ex, ey):
+        return self.append("Q", cx, cy, ex, ey)
+
+    def Z(self):
+        return self.append("Z")
+
+    @property
+    def d(self):
+        return " ".join(command + ",".join(map(str, args)) for (command, args) in self.commands)
+
+    # Return commands with rounded coordinates, where straight quadratic curves become lines
+    # and consecutive lines in the same direction are merged
+    def getSimplifiedCommands(self, precision):
+        commands = []
+        (x, y) = (0, 0)
+        for (command, args) in self.commands:
+            args = tuple(roundNumber(float(value), precision) for value in args)
+            if command == "Q" and isOnSegment(args[0], args[1], x, y, args[2], args[3]):
+                (command, args) = ("L", args[2:])
+            if command == "L" and len(commands) > 0 and commands[-1][0] == "L":
+                (previous_x, previous_y) = commands[-2][1][-2:] if len(commands) > 1 else (0, 0)
+                if isOnSegment(x, y, previous_x, previous_y, args[0], args[1]):
+                    commands.pop()
+            if command in ("M", "L", "Q"):
+                (x, y) = args[-2:]
+            commands.append((command, args))
+        return commands
+
+    # Compact path data : coordinates rounded to precision digits, for each command
+    # the shortest of absolute, relative and horizontal/vertical forms
+    def formatCompact(self, precision):
+        chunks = []
+        (x, y) = (0, 0)
+        (start_x, start_y) = (0, 0)
+        for (command, args) in self.getSimplifiedCommands(precision):
+            relative_args = tuple(roundNumber(float(value - (y if i % 2 else x)), precision)
+                                  for i, value in enumerate(args))
+            candidates = [command + formatNumbers(args), command.lower() + formatNumbers(relative_args)]
+            if command == "L" and args[1] == y:
+                candidates += ["H" + formatNumbers(args[:1]), "h" + formatNumbers(relative_args[:1])]
+            elif command == "L" and args[0] == x:
+                candidates += ["V" + formatNumbers(args[1:]), "v" + formatNumbers(relative_args[1:])]
+            chunks.append(min(candidates, key=len))
+
+            if command == "M":
+                (start_x, start_y) = args
+            if command == "Z":
+                (x, y) = (start_x, start_y)
+            else:
+                (x, y) = args[-2:]
+        return "".join(chunks)
+
+
+def formatNumbers(numbers):
+    return ",".join(map(str, numbers))
+
+
+# Return True if (x, y) is on the segment from (ax, ay) to (bx, by)
+def isOnSegment(x, y, ax, ay, bx, by):
+    if (x - ax) * (by - ay) != (y - ay) * (bx - ax):
+        return False
+    return min(ax, bx) <= x <= max(ax, bx) and min(ay, by) <= y <= max(ay, by)
+
+
+def arrowPathData():
+    return PathData().M(-ARROW_LENGTH, 3).L(-ARROW_LENGTH, -3).L(2, 0).Z().d
+
+
+class StyleClasses:
+    # Replace presentation attributes shared by many elements with generated css classes
+
+    style_attributes = ("fill", "stroke", "stroke_width", "stroke_dasharray", "stroke_miterlimit",
+                        "font_size", "font_family", "font_weight", "text_anchor", "dominant_baseline")
+
+    # Unitless lengths are not valid in css
+    length_attributes = ("stroke_width", "font_size")
+
+    def __init__(self):
+        self.classes = {}
+
+    # Return element args where presentation attributes are replaced by a class
+    def compact(self, args):
+        element_args = {}
+        style = []
+        for name, value in args.items():
+            if name in self.style_attributes:
+                if value is not None:
+                    style.append((name, value))
+            else:
+                element_args[name] = value
+        style = tuple(sorted(style))
+        if style not in self.classes:
+            self.classes[style] = F"s{len(self.classes)}"
+        element_args["class"] = self.classes[style]
+        return element_args
+
+    def getCss(self):
+        rules = []
+        for style, class_name in self.classes.items():
+            properties = ";".join(F"{name.replace('_', '-')}:{value}{'px' if name in self.length_attributes else ''}"
+                                  for name, value in style)
+            rules.append(F".{class_name}{{{properties}}}")
+        return "\n".join(rules)
+
+    # The style element is written after all elements, so classes can be generated while drawing
+    def getStyleElement(self):
+        return F"<style>{self.getCss()}</style>"
+
+
+class Renderer:
+    # Base class of renderers, drawing chart elements as svg rect, path and text elements
+    # With style_classes, presentation attributes are replaced by css classes
+    # With precision, coordinates are rounded to this number of digits and paths are compacted
+
+    def __init__(self, style_classes=None, precision=None):
+        self.style_classes = style_classes
+        self.precision = precision
+
+    def getElementArgs(self, args):
+        if self.precision is not None:
+            args = {name: roundNumber(value, self.precision) for name, value in args.items()}
+        return args if self.style_classes is None else self.style_classes.compact(args)
+
+    def formatPath(self, path):
+        return path.d if self.precision is None else path.formatCompact(self.precision)
+
+
+class DrawsvgRenderer(Renderer):
+    # Draw chart elements by building a drawsvg drawing in memory
+
+    def __init__(self, drawing, style_classes=None, precision=None):
+        super().__init__(style_classes, precision)
+        # drawsvg is only needed by this renderer, imported once instead of for each element
+        import drawsvg
+        self.draw = drawsvg
+        self.drawing = drawing
+        self.markers = {}
+
+    def arrowMarker(self, edge):
+        # The same marker object is returned for a given color so drawsvg writes it once in defs
+        if edge.color not in self.markers:
+            draw = self.draw
+            arrow = draw.Marker(-ARROW_LENGTH, -5, 2, 5, orient='auto-start-reverse')
+            arrow.append(draw.Path(arrowPathData(), fill=edge.color))
+            self.markers[edge.color] = arrow
+        return self.markers[edge.color]
+
+    def drawElement(self, element):
+        element.draw(self)
+
+    def drawStyle(self):
+        if self.style_classes is not None:
+            self.drawing.append(self.draw.Raw(self.style_classes.getStyleElement()))
+
+    def rectangle(self, x, y, width, height, **args):
+        self.drawing.append(self.draw.Rectangle(**self.getElementArgs({"x": x, "y": y, "width": width,
+                                                                       "height": height, **args})))
+
+    def path(self, path, **args):
+        self.drawing.append(self.draw.Path(**self.getElementArgs({"d": self.formatPath(path), **args})))
+
+    def text(self, text, font_size, x, y, **args):
+        args = self.getElementArgs({"x": x, "y": y, "font_size": font_size, **args})
+        self.drawing.append(self.draw.Text(text, args.pop("font_size", None), **args))
+
+
+class SvgStreamRenderer(Renderer):
+    # Write chart elements straight to the output file, without building any drawsvg object
+    # The output is the same as the one produced by DrawsvgRenderer
+    # With cache_fragments=True, elements write their cached svg fragment instead of being drawn again
+
+    def __init__(self, file, marker_ids=None, style_classes=None, precision=None, cache_fragments=False):
+        super().__init__(style_classes, precision)
+        self.file = file
+        self.marker_ids = {} if marker_ids is None else marker_ids
+        self.cache_fragments = cache_fragments
+        # Options the svg of elements depends on, set with marker ids (see ChartElement.getSvgFragment)
+        self.fragment_options = None
+
+    def writeElement(self, tag, args, content=None):
+        chunks = ["<", tag]
+        for name, value in args.items():
+            if value is not None:
+                chunks.append(F' {name.replace("_", "-")}="{value}"')
+        if content is None:
+            chunks.append(" />\n")
+        else:
+            chunks.append(F">{escapeText(content)}</{tag}>\n")
+        self.file.write("".join(chunks))
+
+    # size is the (width, height) of the rendered image, the size of rect by default
+    def writeHeader(self, rect, size=None):
+        (min_x, min_y, width, height) = (roundNumber(value, self.precision)
+                                         for value in (rect.min_x, rect.min_y, rect.getWidth(), rect.getHeight()))
+        (render_width, render_height) = size or (width, height)
+        self.file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                        '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink"\n    '
+                        F' width="{render_width}" height="{render_height}" '
+                        F'viewBox="{min_x} {min_y} {width} {height}">\n')
+
+    def writeDefs(self, marker_colors):
+        # Marker definitions must be written before the elements referencing them
+        self.file.write("<defs>\n")
+        for color in marker_colors:
+            marker_id = F"d{len(self.marker_ids)}"
+            self.marker_ids[color] = marker_id
+            width = ARROW_LENGTH + 2
+            self.file.write(F'<marker markerWidth="{width}" markerHeight="10" '
+                            F'viewBox="{-ARROW_LENGTH} -5 {width} 10" orient="auto-start-reverse" id="{marker_id}">\n'
+                            F'<path d="{arrowPathData()}" fill="{color}" />\n'
+                            '</marker>\n')
+        self.file.write("</defs>\n")
+        self.fragment_options = (tuple(self.marker_ids.items()), self.style_classes is not None, self.precision)
+
+    def drawStyle(self):
+        if self.style_classes is not None:
+            self.file.write(self.style_classes.getStyleElement() + "\n")
+
+    def writeFooter(self):
+        self.file.write("</svg>")
+
+    def arrowMarker(self, edge):
+        return F"url(#{self.marker_ids[edge.color]})"
+
+    def drawElement(self, element):
+        if self.cache_fragments:
+            self.file.write(element.getSvgFragment(self))
+        else:
+            element.draw(self)
+
+    def rectangle(self, x, y, width, height, **args):
+        self.writeElement("rect", self.getElementArgs({"x": x, "y": y, "width": width, "height": height, **args}))
+
+    def path(self, path, **args):
+        self.writeElement("path", self.getElementArgs({"d": self.formatPath(path), **args}))
+
+    def text(self, text, font_size, x, y, **args):
+        self.writeElement("text", self.getElementArgs({"x": x, "y": y, "font_size": font_size, **args}), text)
+
+
+class TextChunkWriter:
+    # Text file written by SvgStreamRenderer : small writes are gathered in chunks of about chunk_size characters,
+    # encoded to utf-8 and written to stream, any object with a write(bytes) method (http response body, ...)
+
+    def __init__(self, stream, chunk_size=2**16):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.chunks = []
+        self.size = 0
+
+    def write(self, text):
+        self.chunks.append(text)
+        self.size += len(text)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.chunks) > 0:
+            self.stream.write("".join(self.chunks).encode("utf-8"))
+            self.chunks = []
+            self.size = 0
+
+
+class WriterStream(io.RawIOBase):
+    # Binary file interface expected by gzip.GzipFile, for an object which only has a write(bytes) method
+    # Closing it does not close the writer
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.writer.write(bytes(data))
+        return len(data)
+
+
+class ExportStats:
+    # Returned by Chart.exportSvg : element counts and, for each export phase,
+    # wall time in seconds and number of memory blocks allocated (and not freed) during the phase
+    # Counting blocks goes through all memory arenas, its cost grows with the process memory and not with the
+    # exported elements, so blocks are only counted (otherwise None) with profile=True
+
+    def __init__(self, chart, profile=False):
+        self.counts = {"points": len(chart.all_points),
+                       "nodes": len(chart.all_nodes),
+                       "edges": len(chart.all_edges),
+                       "clusters": len(chart.all_clusters)}
+        self.phases = {}
+        self.count_blocks = profile
+
+    @contextmanager
+    def measure(self, phase):
+        start_time = time.perf_counter()
+        start_blocks = sys.getallocatedblocks() if self.count_blocks else None
+        yield
+        # A phase measured several times is accumulated
+        seconds, blocks = self.phases.get(phase, (0, 0 if self.count_blocks else None))
+        if self.count_blocks:
+            blocks += sys.getallocatedblocks() - start_blocks
+        self.phases[phase] = (seconds + time.perf_counter() - start_time, blocks)
+
+    def getTotalTime(self):
+        return sum(seconds for seconds, blocks in self.phases.values())
+
+    def __str__(self):
+        counts = ", ".join(F"{count} {name}" for name, count in self.counts.items())
+        phases = ", ".join(F"{phase} {seconds * 1000:.1f} ms" + (F" ({blocks} blocks)" if blocks is not None else "")
+                           for phase, (seconds, blocks) in self.phases.items())
+        return F"{counts} exported in {self.getTotalTime() * 1000:.1f} ms : {phases}"
+
+
+class RenderCache:
+    # On-disk cache of rendered svg, shared by processes using the same directory
+    # Files are named after a hash of the chart model and the export options, so a chart
+    # exported again with the same content and options is read from the cache instead of rendered
+    # When the directory exceeds max_bytes, least recently used files are removed
+    # hits, misses and evictions count the events of this process
+
+    version = 1
+
+    def __init__(self, directory, max_bytes=256 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    # export_args are the same as Chart.writeSvgStream ones, cache_fragments and profile do not change the svg
+    def getKey(self, chart, compress, export_args):
+        import inspect
+        (parameters, columns) = chart.getModelColumns()
+        # Omitted arguments are replaced by their default values, so they give the same key as explicit ones
+        arguments = inspect.signature(chart.writeSvgStream).bind(None, compress, **export_args)
+        arguments.apply_defaults()
+        options = {name: value for name, value in arguments.arguments.items()
+                   if name not in ("stream", "cache_fragments", "profile")}
+        viewport = options.get("viewport")
+        if viewport is not None:
+            options["viewport"] = (viewport.min_x, viewport.max_x, viewport.min_y, viewport.max_y)
+        content = json.dumps({"version": self.version,
+                              "options": options,
+                              "parameters": parameters,
+                              "columns": columns}, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def getFilename(self, key, compress):
+        return os.path.join(self.directory, key + (".svgz" if compress else ".svg"))
+
+    # Return the cached data or None
+    def read(self, filename):
+        try:
+            with open(filename, "rb") as file:
+                data = file.read()
+            # Files modification time is their last use time, for eviction
+            os.utime(filename)
+            return data
+        except FileNotFoundError:
+            # Not rendered yet, or evicted by another process
+            return None
+
+    def write(self, filename, data):
+        # Written in a temporary file renamed once complete, so other processes never read a partial file
+        import tempfile
+        (handle, temporary_filename) = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(data)
+            os.replace(temporary_filename, filename)
+        except BaseException:
+            os.remove(temporary_filename)
+            raise
+        self.evict()
+
+    # Remove least recently used files until the directory size is under max_bytes
+    def evict(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((".svg", ".svgz")):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for (mtime, size, path) in files)
+        for (mtime, size, path) in sorted(files):
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    # Return the (svg or svgz bytes, ExportStats) of chart, rendered only if not found in cache
+    def getSvg(self, chart, compress=False, **export_args):
+        stats = ExportStats(chart, export_args.get("profile", False))
+        with stats.measure("cache lookup"):
+            filename = self.getFilename(self.getKey(chart, compress, export_args), compress)
+            data = self.read(filename)
+        if data is not None:
+            self.hits += 1
+            logger.info("Render cache hit %s", filename)
+            return (data, stats)
+
+        self.misses += 1
+        stream = io.BytesIO()
+        render_stats = chart.writeSvgStream(stream, compress, **export_args)
+        render_stats.phases = {**stats.phases, **render_stats.phases}
+        data = stream.getvalue()
+        with render_stats.measure("cache write"):
+            self.write(filename, data)
+        return (data, render_stats)
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class ChunkQueueStream(io.RawIOBase):
+    # Binary stream written by an export running in another thread, which sends the written data
+    # by chunks of chunk_size bytes to an asyncio queue of the event loop
+    # The queue is bounded : the export waits while the consumer is late (backpressure)
+
+    def __init__(self, loop, queue, chunk_size):
+        self.loop = loop
+        self.queue = queue
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.cancelled = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            self.put(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size]
+        return len(data)
+
+    def put(self, chunk):
+        if self.cancelled:
+            # Stop the export as soon as the consumer is cancelled
+            raise ExportCancelled()
+        import asyncio
+        asyncio.run_coroutine_threadsafe(self.queue.put(chunk), self.loop).result()
+
+    # Send remaining data and the end of stream (None)
+    def finish(self):
+        if len(self.buffer) > 0:
+            self.put(bytes(self.buffer))
+            self.buffer.clear()
+        self.put(None)
+
+    # Called by the consumer when cancelled : the export stops at its next chunk
+    def cancel(self):
+        self.cancelled = True
+        # Unblock the export if it is waiting for space in the queue
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+def toList(values):
+    # numpy arrays and pandas series convert themselves to python values much faster than iterating them
+    return values.tolist() if hasattr(values, "tolist") else list(values)
+
+
+def toEnum(enum, value):
+    return value if isinstance(value, enum) else enum[value]
+
+
+def parseNumber(string):
+    if string == "":
+        return None
+    try:
+        return int(string)
+    except ValueError:
+        return float(string)
+
+
+# Return csv file content as a dict of columns, numeric_columns values are converted to numbers
+# (None for blank cells), blank cells of the columns in defaults dict are replaced by their default value
+def readCsvColumns(filename, numeric_columns, defaults=None):
+    with open(filename, newline='') as file:
+        reader = csv.reader(file)
+        names = next(reader)
+        columns = list(zip(*reader)) or [()] * len(names)
+    table = {}
+    for name, column in zip(names, columns):
+        if name in numeric_columns:
+            table[name] = [parseNumber(value) for value in column]
+        elif defaults is not None and name in defaults:
+            default = defaults[name]
+            table[name] = [default if value == "" else value for value in column]
+        else:
+            table[name] = list(column)
+    return table
+
+
+# Chart model files (see Chart.save and loadChart) store each element attribute as a column
+MODEL_FORMAT = "svg_chart"
+MODEL_VERSION = 1
+MODEL_MAGIC = b"SVGCHART"
+STRING_COLUMNS = ("point_text", "node_text", "node_color", "edge_text", "edge_color", "cluster_text",
+                  "cluster_color")
+
+
+# Return the array typecode and values storing numbers, ints and floats are restored as they were saved
+# (an int and a float of the same value are not exported the same way in svg)
+def encodeNumbers(values):
+    if all(type(value) is int for value in values):
+        return (getIntegerTypecode(values), values, None)
+    is_int = [type(value) is int for value in values]
+    return ("d", [float(value) for value in values], is_int if any(is_int) else None)
+
+
+# Return the smallest array typecode storing all values (enums, flags and indices are mostly small)
+def getIntegerTypecode(values):
+    (low, high) = (min(values, default=0), max(values, default=0))
+    for typecode in ("b", "h", "i", "q"):
+        bits = array.array(typecode).itemsize * 8 - 1
+        if -2 ** bits <= low and high < 2 ** bits:
+            return typecode
+    raise OverflowError("Integer too large to be saved in a chart model")
+
+
+def decodeNumbers(values, is_int):
+    if is_int is None:
+        return values
+    return [int(value) if value_is_int else value for value, value_is_int in zip(values, is_int)]
+
+
+# Write columns in a binary file whose numeric columns can be memory mapped :
+# magic, json header length (8 bytes), json header, then each column array aligned on 8 bytes
+def writeBinaryModel(file, parameters, columns):
+    strings = {}
+    arrays = {}
+    for name, values in columns.items():
+        if name in STRING_COLUMNS:
+            # Strings (mostly a few distinct colors) are saved once and referenced by index
+            indices = [strings.setdefault(value, len(strings)) for value in values]
+            arrays[name] = array.array(getIntegerTypecode(indices), indices)
+        else:
+            (typecode, numbers, is_int) = encodeNumbers(values)
+            arrays[name] = array.array(typecode, numbers)
+            if is_int is not None:
+                arrays[name + ".is_int"] = array.array("b", is_int)
+
+    layout = {}
+    offset = 0
+    for name, values in arrays.items():
+        layout[name] = (values.typecode, offset, len(values))
+        offset += -(-len(values) * values.itemsize // 8) * 8
+    header = json.dumps({"format": MODEL_FORMAT,
+                         "version": MODEL_VERSION,
+                         "byteorder": sys.byteorder,
+                         "parameters": parameters,
+                         "strings": list(strings),
+                         "columns": layout}).encode()
+    header += b" " * (-len(header) % 8)
+
+    file.write(MODEL_MAGIC)
+    file.write(struct.pack("<Q", len(header)))
+    file.write(header)
+    for values in arrays.values():
+        data = values.tobytes()
+        file.write(data)
+        file.write(b"\0" * (-len(data) % 8))
+
+
+def readBinaryModel(filename):
+    with open(filename, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MODEL_MAGIC)] != MODEL_MAGIC:
+                raise ValueError(F"{filename} is not a svg_chart model file")
+            (header_length,) = struct.unpack_from("<Q", data, len(MODEL_MAGIC))
+            data_offset = len(MODEL_MAGIC) + 8 + header_length
+            header = json.loads(data[len(MODEL_MAGIC) + 8:data_offset])
+            checkModelHeader(filename, header)
+
+            arrays = {}
+            with memoryview(data) as view:
+                for name, (typecode, offset, length) in header["columns"].items():
+                    start = data_offset + offset
+                    end = start + length * array.array(typecode).itemsize
+                    if header["byteorder"] == sys.byteorder:
+                        # Column values are read directly from the mapped file
+                        with view[start:end] as column_view, column_view.cast(typecode) as column:
+                            arrays[name] = column.tolist()
+                    else:
+                        values = array.array(typecode, view[start:end])
+                        values.byteswap()
+                        arrays[name] = values.tolist()
+
+    strings = header["strings"]
+    columns = {}
+    for name, values in arrays.items():
+        if name.endswith(".is_int"):
+            continue
+        if name in STRING_COLUMNS:
+            columns[name] = [strings[i] for i in values]
+        else:
+            columns[name] = decodeNumbers(values, arrays.get(name + ".is_int"))
+    return (header["parameters"], columns)
+
+
+def checkModelHeader(filename, header):
+    if header.get("format") != MODEL_FORMAT:
+        raise ValueError(F"{filename} is not a svg_chart model file")
+    if header.get("version") != MODEL_VERSION:
+        raise ValueError(F"{filename} model version {header.get('version')} is not supported")
+
+
+# Create an element without running its constructor (borders and border orders are already resolved)
+def restoreElement(element_class, chart, attributes):
+    element = element_class.__new__(element_class)
+    ChartElement.__init__(element, chart)
+    for name, value in attributes:
+        object.__setattr__(element, name, value)
+    return element
+
+
+# Create count elements without running their constructor, for bulk loading : each attribute is set for all
+# elements at once from a column of values, through the slot descriptor
+def createElements(element_class, chart, count, columns):
+    elements = [element_class.__new__(element_class) for i in range(count)]
+    for (name, values) in (("chart", itertools.repeat(chart)),) + columns:
+        # Consume the map without building a list of results
+        deque(map(getattr(element_class, name).__set__, elements, values), maxlen=0)
+    return elements
+
+
 class Chart:
+    geometry_attributes = ("font_size", "node_width", "node_height",
+                           "horizontal_node_space", "vertical_node_space", "cluster_margin", "auto_size")
+
     def __init__(self,
                  font_size=20,
                  node_width=150,
                  node_height=40,
                  horizontal_node_space=50,
                  vertical_node_space=30,
-                 cluster_margin=15):
+                 cluster_margin=15,
+                 auto_size=False):
+        # Incremented each time a position, a spacing or an edge slot changes, to invalidate cached rects
+        self.geometry_version = 0
+
+        # Css classes referenced by cached svg fragments, and lock of the exports using them
+        self.fragment_style_classes = StyleClasses()
+        self.fragment_lock = threading.Lock()
+
+        # Element -> rect, emptied when the geometry changes
+        self.rects = {}
+        # Element -> (key, svg) of exports with cache_fragments
+        self.fragments = {}
+
+        # Built on demand and rebuilt when the geometry changes
+        self.spatial_index = None
+        self.spatial_index_version = None
+        self.edge_geometry = None
+        self.edge_geometry_version = None
+        # Element -> clusters having it as child, used to update the rects of the clusters of a moved node
+        self.cluster_parents = None
+
         self.font_size = font_size
         self.node_width = node_width
         self.node_height = node_height
         self.horizontal_node_space = horizontal_node_space
         self.vertical_node_space = vertical_node_space
         self.cluster_margin = cluster_margin
+        # Widen nodes to fit their text and include edge labels in the chart extent (see measureText)
+        self.auto_size = auto_size
 
         self.all_points = []
         self.all_nodes = []
         self.all_edges = []
         self.all_clusters = []
 
-        self.horizontal_step = node_width + horizontal_node_space
-        self.vertical_step = node_height + vertical_node_space
-
-        print(F"New chart")
-
+        # (edge, node_a_border_order, node_b_border_order) of edges waiting for their nodes positions
+        self.pending_edges = []
+        # Nodes without position (created without or with col or row set to None), waiting for layoutNodes
+        self.unpositioned_node_count = 0
+
+        logger.debug("New chart")
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in self.geometry_attributes:
+            self.invalidateGeometry()
+
+    # Charts are pickled (to be sent to other processes) as model columns : pickling elements
+    # referencing each other would recurse through the whole graph
+    def __reduce__(self):
+        return (createChartFromModel, self.getModelColumns())
+
+    def invalidateGeometry(self):
+        self.geometry_version += 1
+        if len(self.rects) > 0:
+            self.rects = {}
+        self.cluster_parents = None
+
+    # Update the caches after node moved or was resized, instead of invalidating the whole chart geometry :
+    # edge borders and slots do not depend on node positions, so only the rects, svg fragments, edge geometry
+    # and spatial index entries of the node, its edges and the clusters containing it change
+    def invalidateNodeGeometry(self, node):
+        edges = list(dict.fromkeys(edge for orders_and_edges in (node.edges or {}).values()
+                                   for (order, edge) in orders_and_edges))
+        elements = [node] + edges
+        if node in self.rects:
+            # Cluster rects are computed from the rects of their children
+            elements.extend(self.getContainingClusters(node))
+        index = self.spatial_index if self.spatial_index_version == self.geometry_version else None
+        orders = []
+        for element in elements:
+            self.fragments.pop(element, None)
+            rect = self.rects.pop(element, None)
+            if index is not None:
+                # All element rects are cached while the spatial index is current
+                orders.append(index.remove(element, rect))
+        if self.edge_geometry_version == self.geometry_version:
+            for edge in edges:
+                ((xa, ya), (xb, yb)) = anchors = edge.getAnchors()
+                self.edge_geometry[edge] = (xa, ya, xb, yb, *edge.getCenter(anchors))
+        if index is not None:
+            for element, order in zip(elements, orders):
+                index.insert(element, order)
+
+    # Return the clusters containing element, directly or through other clusters
+    def getContainingClusters(self, element):
+        if self.cluster_parents is None:
+            self.cluster_parents = {}
+            for cluster in self.all_clusters:
+                for child in cluster.children:
+                    self.cluster_parents.setdefault(child, []).append(cluster)
+        clusters = {}
+        pending = [element]
+        while pending:
+            for cluster in self.cluster_parents.get(pending.pop(), ()):
+                if cluster not in clusters:
+                    clusters[cluster] = None
+                    pending.append(cluster)
+        return list(clusters)
+
+    # Drop the rects, edge geometry, spatial index and svg fragments cached by exports to free their memory,
+    # the next export computes them again
+    # Called after exports of the whole chart without cache_fragments, and after exportTiles
+    def releaseCaches(self):
+        self.rects = {}
+        self.fragments = {}
+        self.edge_geometry = None
+        self.edge_geometry_version = None
+        self.spatial_index = None
+        self.spatial_index_version = None
+        self.cluster_parents = None
+
+    @property
+    def horizontal_step(self):
+        return self.node_width + self.horizontal_node_space
+
+    @property
+    def vertical_step(self):
+        return self.node_height + self.vertical_node_space
+
+    # New elements change the chart extent and spatial index, and new edges the edge slots of their nodes
     def addPoint(self, point):
         self.all_points.append(point)
+        self.invalidateGeometry()
 
     def addNode(self, node):
         self.all_nodes.append(node)
+        if not node.isPositioned():
+            self.unpositioned_node_count += 1
+        self.invalidateGeometry()
 
     def addEdge(self, edge):
         self.all_edges.append(edge)
+        self.invalidateGeometry()
 
     def addCluster(self, cluster):
         self.all_clusters.append(cluster)
+        self.invalidateGeometry()
+
+    def addPendingEdge(self, edge, node_a_border_order, node_b_border_order):
+        self.pending_edges.append((edge, node_a_border_order, node_b_border_order))
+
+    # Set col and row of nodes created without position (None col and row) with a LayeredLayout
+    # of the edges between them : edges go down from node_a to node_b on consecutive rows
+    # Positioned nodes are not moved, laid out nodes are placed on the rows below them
+    # Crossing reduction stops after max_iterations down and up sweeps or time_limit seconds
+    # Return the number of positioned nodes
+    def layoutNodes(self, max_iterations=8, time_limit=None):
+        start = time.perf_counter()
+        nodes = [node for node in self.all_nodes if not node.isPositioned()]
+        node_indices = {node: i for i, node in enumerate(nodes)}
+        links = [(node_indices[edge.node_a], node_indices[edge.node_b])
+                 for (edge, node_a_border_order, node_b_border_order) in self.pending_edges
+                 if edge.node_a in node_indices and edge.node_b in node_indices]
+
+        layout = LayeredLayout(len(nodes), links)
+        deadline = start + time_limit if time_limit is not None else None
+        sweep_count = layout.reduceCrossings(max_iterations, deadline)
+
+        first_row = max((node.row for node in self.all_nodes if node.isPositioned()), default=-1) + 1
+        for (node, col, layer) in zip(nodes, layout.cols, layout.layers):
+            node.col = col
+            node.row = first_row + layer
+
+        # Edges are added to node borders in creation order, as if nodes were created with their positions
+        for (edge, node_a_border_order, node_b_border_order) in self.pending_edges:
+            edge.resolveBorders(node_a_border_order, node_b_border_order)
+        # Positioning the nodes above also counted them down to 0
+        self.pending_edges = []
+        self.invalidateGeometry()
+
+        logger.info("%d nodes laid out on %d rows in %.3f s (%d crossing reduction sweeps)", len(nodes),
+                    len(layout.rows), time.perf_counter() - start, sweep_count)
+        return len(nodes)
+
+    # Bulk creation of nodes from columns of the same length : sequences, numpy arrays or pandas series
+    # texts, colors and shapes are optional, shapes can be NodeShape values or names
+    # Return the list of created nodes
+    def addNodes(self, cols, rows, texts=None, colors=None, shapes=None):
+        cols = toList(cols)
+        rows = toList(rows)
+        count = len(cols)
+        assert (len(rows) == count)
+        texts = toList(texts) if texts is not None else [""] * count
+        colors = toList(colors) if colors is not None else ["white"] * count
+        shapes = [toEnum(NodeShape, shape) for shape in toList(shapes)] if shapes is not None \
+            else [NodeShape.RECTANGLE] * count
+
+        # Nodes are created column by column, without constructor, and the geometry is invalidated once
+        nodes = createElements(Node, self, count, (("col", cols), ("row", rows), ("text", texts), ("color", colors),
+                                                   ("shape", shapes), ("edges", itertools.repeat(None)),
+                                                   ("edge_slots", itertools.repeat(None))))
+        self.all_nodes.extend(nodes)
+        self.unpositioned_node_count += sum(not node.isPositioned() for node in nodes)
+        self.invalidateGeometry()
+        logger.debug("%d new nodes", count)
+        return nodes
+
+    # Bulk creation of edges from columns of the same length : sequences, numpy arrays or pandas series
+    # node_a_indices and node_b_indices are indices in nodes list (all chart nodes by default)
+    # edge_strings, texts, colors, layouts (EdgeLayout values or names) and border orders are optional
+    # Return the list of created edges
+    def addEdges(self, node_a_indices, node_b_indices, edge_strings=None, texts=None, colors=None, layouts=None,
+                 node_a_border_orders=None, node_b_border_orders=None, nodes=None):
+        if nodes is None:
+            nodes = self.all_nodes
+        nodes_a = [nodes[i] for i in toList(node_a_indices)]
+        nodes_b = [nodes[i] for i in toList(node_b_indices)]
+        count = len(nodes_a)
+        assert (len(nodes_b) == count)
+        edge_strings = toList(edge_strings) if edge_strings is not None else ["-"] * count
+        texts = toList(texts) if texts is not None else [""] * count
+        colors = toList(colors) if colors is not None else ["black"] * count
+        layouts = [toEnum(EdgeLayout, layout) for layout in toList(layouts)] if layouts is not None \
+            else [EdgeLayout.AUTO] * count
+        node_a_border_orders = toList(node_a_border_orders) if node_a_border_orders is not None else [None] * count
+        node_b_border_orders = toList(node_b_border_orders) if node_b_border_orders is not None else [None] * count
+
+        # Edges are created column by column, without constructor, then added to their node borders
+        # (borders depend on each edge nodes positions), and the geometry is invalidated once
+        arrows = [parseEdgeString(edge_string) for edge_string in edge_strings]
+        edges = createElements(Edge, self, count, (("dashed", [dashed for (dashed, a, b) in arrows]),
+                                                   ("node_a", nodes_a), ("node_b", nodes_b),
+                                                   ("node_a_arrow", [a for (dashed, a, b) in arrows]),
+                                                   ("node_b_arrow", [b for (dashed, a, b) in arrows]),
+                                                   ("text", texts), ("color", colors), ("layout", layouts),
+                                                   ("node_a_border", itertools.repeat(None)),
+                                                   ("node_b_border", itertools.repeat(None))))
+        for (edge, node_a, node_b, node_a_border_order, node_b_border_order) in zip(
+                edges, nodes_a, nodes_b, node_a_border_orders, node_b_border_orders):
+            if node_a.isPositioned() and node_b.isPositioned():
+                edge.resolveBorders(node_a_border_order, node_b_border_order)
+            else:
+                self.addPendingEdge(edge, node_a_border_order, node_b_border_order)
+        self.all_edges.extend(edges)
+        self.invalidateGeometry()
+        logger.debug("%d new edges", count)
+        return edges
+
+    # table is a pandas DataFrame or a dict of columns with 'col', 'row' and optional 'text', 'color', 'shape'
+    def addNodesFromTable(self, table):
+        return self.addNodes(*(table[name] if name in table else None
+                               for name in ("col", "row", "text", "color", "shape")))
+
+    # table is a pandas DataFrame or a dict of columns with 'node_a', 'node_b' (node indices) and optional
+    # 'edge_string', 'text', 'color', 'layout', 'node_a_border_order', 'node_b_border_order'
+    def addEdgesFromTable(self, table, nodes=None):
+        return self.addEdges(*(table[name] if name in table else None
+                               for name in ("node_a", "node_b", "edge_string", "text", "color", "layout",
+                                            "node_a_border_order", "node_b_border_order")),
+                             nodes=nodes)
+
+    # Load nodes and optional edges from csv files with the same columns as addNodesFromTable
+    # and addEdgesFromTable, edge node indices refer to the nodes csv rows
+    # Blank cells of optional columns give the default value of the attribute (None for col, row and border orders)
+    def loadCsv(self, nodes_filename, edges_filename=None):
+        nodes = self.addNodesFromTable(readCsvColumns(nodes_filename, ("col", "row"),
+                                                      {"color": "white", "shape": NodeShape.RECTANGLE}))
+        edges = []
+        if edges_filename is not None:
+            edges = self.addEdgesFromTable(readCsvColumns(edges_filename, ("node_a", "node_b", "node_a_border_order",
+                                                                           "node_b_border_order"),
+                                                          {"edge_string": "-", "color": "black",
+                                                           "layout": EdgeLayout.AUTO}),
+                                           nodes=nodes)
+        return (nodes, edges)
+
+    # Return the chart parameters and all elements attributes as columns, elements are referenced by index
+    # in points + nodes + edges + clusters (edge ends and cluster children)
+    # Used to save, pickle and hash charts for exports, so it fails like exports on nodes without position
+    def getModelColumns(self):
+        if self.pending_edges or self.unpositioned_node_count > 0:
+            raise ValueError("Chart has nodes without position, call layoutNodes before exporting it")
+        if any(type(node) is not Node for node in self.all_nodes) or \
+                any(type(edge) is not Edge for edge in self.all_edges):
+            raise ValueError("Level of detail charts can not be saved, save the chart they are made from")
+        parameters = {name: getattr(self, name) for name in self.geometry_attributes}
+        elements = self.all_points + self.all_nodes + self.all_edges + self.all_clusters
+        element_indices = {element: i for i, element in enumerate(elements)}
+        border_orders = self.getBorderOrders()
+
+        columns = {
+            "point_col": [point.col for point in self.all_points],
+            "point_row": [point.row for point in self.all_points],
+            "point_text": [point.text for point in self.all_points],
+            "node_col": [node.col for node in self.all_nodes],
+            "node_row": [node.row for node in self.all_nodes],
+            "node_text": [node.text for node in self.all_nodes],
+            "node_color": [node.color for node in self.all_nodes],
+            "node_shape": [node.shape.value for node in self.all_nodes],
+            "edge_node_a": [element_indices[edge.node_a] for edge in self.all_edges],
+            "edge_node_b": [element_indices[edge.node_b] for edge in self.all_edges],
+            "edge_dashed": [int(edge.dashed) for edge in self.all_edges],
+            "edge_node_a_arrow": [int(edge.node_a_arrow) for edge in self.all_edges],
+            "edge_node_b_arrow": [int(edge.node_b_arrow) for edge in self.all_edges],
+            "edge_text": [edge.text for edge in self.all_edges],
+            "edge_color": [edge.color for edge in self.all_edges],
+            "edge_layout": [edge.layout.value for edge in self.all_edges],
+            "edge_node_a_border": [edge.node_a_border.value for edge in self.all_edges],
+            "edge_node_b_border": [edge.node_b_border.value for edge in self.all_edges],
+            # Points do not order their edges, 0 is saved for them
+            "edge_node_a_border_order": [border_orders.get((edge, "a"), 0) for edge in self.all_edges],
+            "edge_node_b_border_order": [border_orders.get((edge, "b"), 0) for edge in self.all_edges],
+            "cluster_text": [cluster.text for cluster in self.all_clusters],
+            "cluster_color": [cluster.color for cluster in self.all_clusters],
+            "cluster_rounded": [int(cluster.rounded) for cluster in self.all_clusters],
+            # Children of all clusters, cluster_children_end is the end of each cluster children in this list
+            "cluster_children": [element_indices[child] for cluster in self.all_clusters for child in cluster.children],
+            "cluster_children_end": list(itertools.accumulate(len(cluster.children) for cluster in self.all_clusters)),
+        }
+        return (parameters, columns)
+
+    # Return the resolved border order of edge ends, as {(edge, "a" or "b"): border_order}
+    # A self-loop edge on a single border has one entry for each end
+    def getBorderOrders(self):
+        border_orders = {}
+        for node in self.all_nodes:
+            if node.edges is None:
+                continue
+            for border, orders_and_edges in node.edges.items():
+                for (order, edge) in orders_and_edges:
+                    end = "a" if edge.node_a is node and edge.node_a_border == border and \
+                        (edge, "a") not in border_orders else "b"
+                    border_orders[(edge, end)] = order
+        return border_orders
+
+    # Save the chart model (parameters and elements), to load it later with loadChart without running the code
+    # building it, for example to export it again with other spacing parameters
+    # A filename ending with '.json' is saved as json, otherwise a binary file is written, loaded with mmap
+    def save(self, filename):
+        (parameters, columns) = self.getModelColumns()
+        if filename.endswith(".json"):
+            with open(filename, "w") as file:
+                json.dump({"format": MODEL_FORMAT,
+                           "version": MODEL_VERSION,
+                           "parameters": parameters,
+                           "columns": columns}, file, separators=(",", ":"))
+        else:
+            with open(filename, "wb") as file:
+                writeBinaryModel(file, parameters, columns)
+        logger.info("Chart saved in %s", filename)
+
+    # Order edges on all node borders by the direction of their other end (see Node.orderEdgesByDirection),
+    # instead of creation order or border orders given to Edge constructor, in O(E log E)
+    def orderEdgesOnBorders(self):
+        for node in self.all_nodes:
+            node.orderEdgesByDirection()
+        self.invalidateGeometry()
+        logger.info("Edges ordered on %d nodes borders", len(self.all_nodes))
+
+    # Return (element, text width, available width) of nodes and clusters whose text is wider than them
+    def getLabelOverflows(self):
+        overflows = []
+        for node in self.all_nodes:
+            available_width = self.node_height if node.shape == NodeShape.DIAMOND else node.getWidth()
+            text_width = node.getTextWidth()
+            if text_width > available_width:
+                overflows.append((node, text_width, available_width))
+        for cluster in self.all_clusters:
+            text_width = measureText(cluster.text, self.font_size, font_weight="bold")
+            if text_width > cluster.getRect().getWidth():
+                overflows.append((cluster, text_width, cluster.getRect().getWidth()))
+        return overflows
+
+    # Return a simplified copy of the chart for overview exports, where :
+    # - collapsed_clusters and clusters smaller than min_cluster_size pixels (width and height) at scale
+    #   are replaced by a ClusterSummary box of the same size, hiding their content
+    # - edges between a collapsed cluster and another one (or a node) are replaced by a single
+    #   AggregatedEdge for each pair, whose width grows with the number of replaced edges
+    # - all labels are removed if scale is lower than min_label_scale
+    # scale is the ratio between exported and chart sizes (exported width / chart.getRect().getWidth())
+    # Nested collapsed clusters are merged in the outermost one
+    def getLevelOfDetailChart(self, collapsed_clusters=(), min_cluster_size=None, scale=1, min_label_scale=None):
+        show_labels = min_label_scale is None or scale >= min_label_scale
+        # Cluster rects computed in creation order (children before their parents), so rects of deeply nested
+        # clusters are not computed recursively
+        cluster_rects = {cluster: cluster.getRect() for cluster in self.all_clusters}
+        collapsed = set(collapsed_clusters)
+        if min_cluster_size is not None:
+            collapsed.update(cluster for cluster, rect in cluster_rects.items()
+                             if max(rect.getWidth(), rect.getHeight()) * scale < min_cluster_size)
+
+        # Outermost collapsed cluster containing each element, if any
+        parents = {}
+        for cluster in self.all_clusters:
+            for child in cluster.children:
+                parents.setdefault(child, cluster)
+        owners = {}
+
+        def getOwner(element):
+            # Walk up the parents to an element whose owner is known (or without parent), without recursion
+            # so deeply nested clusters do not reach the recursion limit, then set owners down the chain
+            chain = []
+            while element is not None and element not in owners:
+                chain.append(element)
+                element = parents.get(element)
+            owner = owners[element] if element is not None else None
+            for element in reversed(chain):
+                owner = owner or (element if element in collapsed else None)
+                owners[element] = owner
+            return owner
+
+        chart = Chart(**{name: getattr(self, name) for name in self.geometry_attributes})
+        copies = {}
+        summary_node_counts = {}
+        for node in self.all_nodes:
+            owner = getOwner(node)
+            if owner is not None:
+                summary_node_counts[owner] = summary_node_counts.get(owner, 0) + 1
+        for cluster in self.all_clusters:
+            if getOwner(cluster) is cluster:
+                node_count = summary_node_counts.get(cluster, 0)
+                text = F"{cluster.text} ({node_count} nodes)" if cluster.text != "" else F"{node_count} nodes"
+                copies[cluster] = ClusterSummary(chart, cluster_rects[cluster], text if show_labels else "",
+                                                 "white" if cluster.color == "none" else cluster.color,
+                                                 cluster.rounded)
+        for point in self.all_points:
+            if getOwner(point) is None:
+                copies[point] = Point(chart, point.col, point.row)
+        for node in self.all_nodes:
+            if getOwner(node) is None:
+                copies[node] = Node(chart, node.col, node.row, node.text if show_labels else "", node.color,
+                                    node.shape)
+
+        border_orders = self.getBorderOrders()
+        edge_counts = {}
+        for edge in self.all_edges:
+            (node_a, node_b) = (getOwner(edge.node_a) or edge.node_a, getOwner(edge.node_b) or edge.node_b)
+            if node_a is edge.node_a and node_b is edge.node_b:
+                copies[edge] = Edge(chart, copies[node_a], copies[node_b], edge.getEdgeString(),
+                                    edge.text if show_labels else "", edge.color, edge.layout,
+                                    border_orders.get((edge, "a")), border_orders.get((edge, "b")))
+            elif node_a is not node_b:
+                pair = (node_a, node_b) if (node_b, node_a) not in edge_counts else (node_b, node_a)
+                edge_counts[pair] = edge_counts.get(pair, 0) + 1
+        for (node_a, node_b), count in edge_counts.items():
+            AggregatedEdge(chart, copies[node_a], copies[node_b], count, str(count) if show_labels else "")
 
-    def exportSvg(self, filename):
+        for cluster in self.all_clusters:
+            if getOwner(cluster) is None:
+                # Aggregated edges are not kept in clusters
+                children = [copies.get(getOwner(child) or child) for child in cluster.children]
+                children = [child for child in dict.fromkeys(children) if child is not None]
+                if len(children) > 0:
+                    copies[cluster] = Cluster(chart, children, cluster.text if show_labels else "", cluster.color,
+                                              cluster.rounded)
+
+        summary_count = sum(isinstance(node, ClusterSummary) for node in chart.all_nodes)
+        logger.info("Level of detail chart : %d clusters collapsed, %d nodes and %d edges kept, %d aggregated edges",
+                    summary_count, len(chart.all_nodes) - summary_count, len(chart.all_edges) - len(edge_counts),
+                    len(edge_counts))
+        return chart
+
+    # Arrow markers registry : all arrowed edges with the same color share the same marker definition
+    # Return the number of edges using each marker color, in order of first use
+    def getArrowMarkerColors(self, edges):
+        marker_colors = {}
+        for edge in edges:
+            if edge.hasArrow():
+                marker_colors[edge.color] = marker_colors.get(edge.color, 0) + 1
+        return marker_colors
+
+    def getRect(self):
         # Compute drawing size by iterating all nodes and clusters
         englobing_rect = Rect(math.inf, -math.inf, math.inf, -math.inf)
         for child in self.all_clusters + self.all_edges + self.all_nodes + self.all_points:
             englobing_rect.englobe(child.getRect())
         englobing_rect.enlarge(self.horizontal_node_space, self.vertical_node_space,
                                self.horizontal_node_space, self.vertical_node_space)
+        return englobing_rect
 
-        # Create a new drawing
-        d = draw.Drawing(englobing_rect.max_x - englobing_rect.min_x,
-                         englobing_rect.max_y - englobing_rect.min_y,
-                         origin=(englobing_rect.min_x, englobing_rect.min_y))
+    # Return {edge: (xa, ya, xb, yb, xc, yc)}, the anchors on node borders and the center of all edges,
+    # used by edges to compute their rect and draw their path
+    # Computed node by node for all edges of each border at once, instead of looking for the node position, size
+    # and edge slot again for each edge end, and kept until the chart geometry changes
+    def getEdgeGeometry(self):
+        if self.edge_geometry_version == self.geometry_version:
+            return self.edge_geometry
 
+        (horizontal_step, vertical_step) = (self.horizontal_step, self.vertical_step)
+        (anchors_a, anchors_b) = ({}, {})
+        for node in self.all_nodes:
+            if node.edges is None:
+                continue
+            # Same arithmetic as getBorderCenter and getEdgePointOnBorder, so drawings do not change
+            x = node.col * horizontal_step
+            y = node.row * vertical_step
+            (width, height) = (node.getWidth(), node.getHeight())
+            diamond = node.shape == NodeShape.DIAMOND
+            for border, edges in node.edges.items():
+                count = len(edges)
+                slots = node.getEdgeSlots(border).items() if count > 1 else ((edges[0][1], 0),)
+                if diamond:
+                    c = height / 2
+                    point = ((x - c, y) if border is Border.LEFT else (x, y - c) if border is Border.TOP else
+                             (x + c, y) if border is Border.RIGHT else (x, y + c))
+                    points = [(edge, point) for edge, index in slots]
+                elif border is Border.LEFT or border is Border.RIGHT:
+                    xb = x - width / 2 if border is Border.LEFT else x + width / 2
+                    points = [(edge, (xb, y + height * (index + 1) / (count + 1) - height / 2))
+                              for edge, index in slots]
+                else:
+                    yb = y - height / 2 if border is Border.TOP else y + height / 2
+                    points = [(edge, (x + width * (index + 1) / (count + 1) - width / 2, yb))
+                              for edge, index in slots]
+                for edge, point in points:
+                    # Both ends of a self-loop edge can be on the same border
+                    if edge.node_a is node and edge.node_a_border is border:
+                        anchors_a[edge] = point
+                    if edge.node_b is node and edge.node_b_border is border:
+                        anchors_b[edge] = point
+
+        geometry = {}
+        for edge in self.all_edges:
+            if edge.node_a_border is None:
+                # Waiting for layoutNodes
+                continue
+            # Points do not keep their edges
+            anchor_a = anchors_a.get(edge) or edge.node_a.getEdgePointOnBorder(edge.node_a_border, edge)
+            anchor_b = anchors_b.get(edge) or edge.node_b.getEdgePointOnBorder(edge.node_b_border, edge)
+            geometry[edge] = (*anchor_a, *anchor_b, *edge.getCenter((anchor_a, anchor_b)))
+        self.edge_geometry = geometry
+        self.edge_geometry_version = self.geometry_version
+        return geometry
+
+    def getSpatialIndex(self):
+        if self.spatial_index_version != self.geometry_version:
+            self.spatial_index = SpatialIndex(self.horizontal_step, self.vertical_step)
+            for order, element in enumerate(self.all_clusters + self.all_edges + self.all_nodes):
+                self.spatial_index.insert(element, order)
+            self.spatial_index_version = self.geometry_version
+        return self.spatial_index
+
+    # Return clusters, edges and nodes intersecting rect, in drawing order
+    def getElementsInRect(self, rect):
+        elements = self.getSpatialIndex().query(rect)
+        return ([element for element in elements if isinstance(element, Cluster)],
+                [element for element in elements if isinstance(element, Edge)],
+                [element for element in elements if isinstance(element, Node)])
+
+    def draw(self, renderer, englobing_rect, stats, clusters, edges, nodes):
         # Draw englobing white rect
-        d.append(draw.Rectangle(englobing_rect.min_x,
-                                englobing_rect.min_y,
-                                englobing_rect.getWidth(),
-                                englobing_rect.getHeight(),
-                                fill='white',
-                                stroke='none'))
+        renderer.rectangle(englobing_rect.min_x,
+                           englobing_rect.min_y,
+                           englobing_rect.getWidth(),
+                           englobing_rect.getHeight(),
+                           fill='white',
+                           stroke='none')
 
         # Draw all elements (order is important to not hide children by their parent elements)
-        for cluster in self.all_clusters:
-            cluster.draw(d)
-        for edge in self.all_edges:
-            edge.draw(d)
-        for node in self.all_nodes:
-            node.draw(d)
+        with stats.measure("cluster draw"):
+            for cluster in clusters:
+                renderer.drawElement(cluster)
+        with stats.measure("edge draw"):
+            for edge in edges:
+                renderer.drawElement(edge)
+        with stats.measure("node draw"):
+            for node in nodes:
+                renderer.drawElement(node)
+
+        renderer.drawStyle()
+
+    # Return the export stats, the exported area, the clusters, edges and nodes to draw, the arrow marker colors
+    # and the css style classes (None without css)
+    def prepareExport(self, viewport, css, cache_fragments, profile):
+        # Counted when nodes are created or moved, so exports of a viewport do not go through all nodes
+        if self.pending_edges or self.unpositioned_node_count > 0:
+            raise ValueError("Chart has nodes without position, call layoutNodes before exporting it")
+        stats = ExportStats(self, profile)
+
+        with stats.measure("extent"):
+            if viewport is None:
+                englobing_rect = self.getRect()
+                elements = (self.all_clusters, self.all_edges, self.all_nodes)
+            else:
+                englobing_rect = viewport
+                elements = self.getElementsInRect(viewport)
+                stats.counts.update({"clusters": len(elements[0]),
+                                     "edges": len(elements[1]),
+                                     "nodes": len(elements[2])})
+            marker_colors = self.getArrowMarkerColors(elements[1])
+
+        stats.counts["markers"] = len(marker_colors)
+        stats.counts["arrowed edges"] = sum(marker_colors.values())
+        if len(marker_colors) > 0:
+            logger.info("%d arrow markers shared by %d edges (dedup ratio %.1f)", len(marker_colors),
+                        stats.counts["arrowed edges"], stats.counts["arrowed edges"] / len(marker_colors))
+
+        style_classes = None
+        if css:
+            # Cached fragments reference classes of previous exports, so they are kept in the chart
+            style_classes = self.fragment_style_classes if cache_fragments else StyleClasses()
+
+        return (stats, englobing_rect, elements, marker_colors, style_classes)
+
+    # streaming=True writes elements directly to the file instead of building a drawsvg drawing,
+    # it produces the same output with a much lower memory usage on large charts
+    # cache_fragments=True keeps the svg rendered for each element (implies streaming), so next exports
+    # only render again the elements modified in between
+    # css=True replaces the presentation attributes repeated on many elements with css classes,
+    # which makes the file much smaller
+    # viewport is a Rect : only the area and the elements intersecting it are exported
+    # size is the (width, height) of the rendered image, the size of the exported area by default
+    # precision is the number of digits kept after the decimal point in coordinates (all by default),
+    # with a precision, path data is also compacted (shortest of relative/absolute commands, merged lines)
+    # render_cache is a RenderCache : the svg is copied from the cache if this chart was already exported
+    # with the same content and options (implies streaming)
+    # A filename ending with '.svgz' is compressed on the fly (implies streaming)
+    # profile=True also counts the memory blocks allocated in each export phase (see ExportStats)
+    # Return an ExportStats with element counts and time spent in each export phase
+    def exportSvg(self, filename, streaming=False, cache_fragments=False, css=False, viewport=None, size=None,
+                  precision=None, render_cache=None, profile=False):
+        compress = filename.endswith(".svgz")
+        if render_cache is not None:
+            (data, stats) = render_cache.getSvg(self, compress, cache_fragments=cache_fragments, css=css,
+                                                viewport=viewport, size=size, precision=precision, profile=profile)
+            with open(filename, 'wb') as file:
+                file.write(data)
+            return stats
+        if streaming or cache_fragments or compress:
+            with open(filename, 'wb') as stream:
+                return self.writeSvgStream(stream, compress, cache_fragments=cache_fragments, css=css,
+                                           viewport=viewport, size=size, precision=precision, profile=profile)
+
+        (stats, englobing_rect, elements, marker_colors, style_classes) = \
+            self.prepareExport(viewport, css, False, profile)
+
+        # Create a new drawing
+        import drawsvg as draw
+        d = draw.Drawing(roundNumber(englobing_rect.getWidth(), precision),
+                         roundNumber(englobing_rect.getHeight(), precision),
+                         origin=(roundNumber(englobing_rect.min_x, precision),
+                                 roundNumber(englobing_rect.min_y, precision)))
+        if size is not None:
+            d.set_render_size(*size)
+        self.draw(DrawsvgRenderer(d, style_classes, precision), englobing_rect, stats, *elements)
 
         # Finally save
-        d.save_svg(filename)
+        with stats.measure("serialization"):
+            d.save_svg(filename)
+        if viewport is None:
+            self.releaseCaches()
+
+        logger.info("%s", stats)
+        return stats
+
+    # Write the svg with the streaming writer to a writable binary stream (file, socket, BytesIO, ...),
+    # any object with a write(bytes) method
+    # compress=True writes gzip compressed svg (svgz) on the fly, the uncompressed svg is never held in memory
+    # Other arguments are the same as exportSvg ones
+    # Return an ExportStats
+    def writeSvgStream(self, stream, compress=False, compression_level=9, cache_fragments=False, css=False,
+                       viewport=None, size=None, precision=None, profile=False):
+        # Exports sharing the cached fragments of elements and their css classes run one at a time
+        with self.fragment_lock if cache_fragments else nullcontext():
+            (stats, englobing_rect, elements, marker_colors, style_classes) = \
+                self.prepareExport(viewport, css, cache_fragments, profile)
+
+            if compress:
+                # mtime=0 so the same chart always gives the same bytes
+                stream = gzip.GzipFile(fileobj=WriterStream(stream), mode='wb', compresslevel=compression_level,
+                                       mtime=0)
+            # Only the write method of stream is used
+            file = TextChunkWriter(stream)
+            renderer = SvgStreamRenderer(file, style_classes=style_classes, precision=precision,
+                                         cache_fragments=cache_fragments)
+            with stats.measure("serialization"):
+                renderer.writeHeader(englobing_rect, size)
+                renderer.writeDefs(marker_colors)
+            self.draw(renderer, englobing_rect, stats, *elements)
+            with stats.measure("serialization"):
+                renderer.writeFooter()
+                file.flush()
+            if compress:
+                with stats.measure("serialization"):
+                    # Write gzip end of stream, the underlying stream is not closed
+                    stream.close()
+        if viewport is None and not cache_fragments:
+            # Caches are kept for next viewport exports (tiles) and exports reusing fragments
+            self.releaseCaches()
+
+        logger.info("%s", stats)
+        return stats
+
+    # Return the svg (or compressed svgz) as bytes, arguments are the same as writeSvgStream ones
+    # render_cache is a RenderCache returning the bytes of a previous export with the same content and options
+    def getSvgBytes(self, compress=False, render_cache=None, **export_args):
+        if render_cache is not None:
+            return render_cache.getSvg(self, compress, **export_args)[0]
+        stream = io.BytesIO()
+        self.writeSvgStream(stream, compress, **export_args)
+        return stream.getvalue()
+
+    # Awaitable export for asyncio applications : the svg is rendered off the event loop and written
+    # by chunks of chunk_size bytes to writer, an object with a write(bytes) method (coroutine or not)
+    # and an optional drain() coroutine (asyncio.StreamWriter, aiohttp StreamResponse, ...)
+    # executor is a concurrent.futures executor, the event loop default thread pool by default
+    # With a thread executor, rendering waits while more than queue_size chunks are not written yet
+    # With a ProcessPoolExecutor, the chart is sent to a process which renders all the svg, then written
+    # Cancelling the awaiting task stops the export
+    # export_args are the same as writeSvgStream ones
+    # Return an ExportStats
+    async def writeSvgAsync(self, writer, executor=None, chunk_size=2**16, queue_size=4, compress=False,
+                            **export_args):
+        import asyncio
+        from concurrent.futures import ProcessPoolExecutor
+        loop = asyncio.get_running_loop()
+        if isinstance(executor, ProcessPoolExecutor):
+            (data, stats) = await loop.run_in_executor(executor, getChartSvg, self, compress, export_args)
+            for start in range(0, len(data), chunk_size):
+                await writeChunk(writer, data[start:start + chunk_size])
+            return stats
+
+        queue = asyncio.Queue(queue_size)
+        stream = ChunkQueueStream(loop, queue, chunk_size)
+
+        def render():
+            stats = self.writeSvgStream(stream, compress, **export_args)
+            stream.finish()
+            return stats
+
+        rendering = loop.run_in_executor(executor, render)
+        try:
+            while True:
+                # Wait for the next chunk, or for the export failure
+                getting = asyncio.ensure_future(queue.get())
+                await asyncio.wait((getting, rendering), return_when=asyncio.FIRST_COMPLETED)
+                if not getting.done():
+                    getting.cancel()
+                    # Raise the export exception
+                    rendering.result()
+                    # The export is done, its last chunks are in the queue
+                    getting = asyncio.ensure_future(queue.get())
+                chunk = await getting
+                if chunk is None:
+                    return await rendering
+                await writeChunk(writer, chunk)
+        except BaseException:
+            stream.cancel()
+            # Wait for the export thread to stop, it raises ExportCancelled at its next chunk
+            await asyncio.gather(rendering, return_exceptions=True)
+            raise
+
+    # Export a pyramid of square svg tiles for a web viewer loading only the visible tiles
+    # Zoom level z splits the chart in 2^z tiles on its largest side, each rendered at tile_size pixels
+    # Tiles are written in directory/<z>/<x>_<y>.svg, export_args are passed to exportSvg
+    # Return the number of tiles for each zoom level, as (columns, rows)
+    def exportTiles(self, directory, zoom_levels=3, tile_size=512, **export_args):
+        englobing_rect = self.getRect()
+        tile_counts = []
+        for zoom in range(zoom_levels):
+            side = max(englobing_rect.getWidth(), englobing_rect.getHeight()) / 2 ** zoom
+            col_count = math.ceil(englobing_rect.getWidth() / side)
+            row_count = math.ceil(englobing_rect.getHeight() / side)
+            os.makedirs(os.path.join(directory, str(zoom)), exist_ok=True)
+            for x in range(col_count):
+                for y in range(row_count):
+                    min_x = englobing_rect.min_x + x * side
+                    min_y = englobing_rect.min_y + y * side
+                    self.exportSvg(os.path.join(directory, str(zoom), F"{x}_{y}.svg"),
+                                   viewport=Rect(min_x, min_x + side, min_y, min_y + side),
+                                   size=(tile_size, tile_size), **export_args)
+            tile_counts.append((col_count, row_count))
+        self.releaseCaches()
+        return tile_counts
+
+
+# Return a Chart created from parameters and columns returned by Chart.getModelColumns
+def createChartFromModel(parameters, columns):
+    chart = Chart(**parameters)
+
+    chart.all_points = [restoreElement(Point, chart, (("col", col), ("row", row), ("text", text)))
+                        for (col, row, text) in zip(columns["point_col"], columns["point_row"],
+                                                    columns["point_text"])]
+
+    node_shapes = list(NodeShape)
+    chart.all_nodes = [restoreElement(Node, chart, (("col", col), ("row", row), ("text", text), ("color", color),
+                                                    ("shape", node_shapes[shape]), ("edges", None),
+                                                    ("edge_slots", None)))
+                       for (col, row, text, color, shape) in zip(columns["node_col"], columns["node_row"],
+                                                                 columns["node_text"], columns["node_color"],
+                                                                 columns["node_shape"])]
+    chart.unpositioned_node_count = sum(not node.isPositioned() for node in chart.all_nodes)
+
+    elements = chart.all_points + chart.all_nodes
+    edge_layouts = list(EdgeLayout)
+    borders = list(Border)
+    for (node_a, node_b, dashed, node_a_arrow, node_b_arrow, text, color, layout, node_a_border, node_b_border,
+         node_a_border_order, node_b_border_order) in zip(*(columns[name] for name in (
+            "edge_node_a", "edge_node_b", "edge_dashed", "edge_node_a_arrow", "edge_node_b_arrow", "edge_text",
+            "edge_color", "edge_layout", "edge_node_a_border", "edge_node_b_border", "edge_node_a_border_order",
+            "edge_node_b_border_order"))):
+        edge = restoreElement(Edge, chart, (("dashed", bool(dashed)), ("node_a", elements[node_a]),
+                                            ("node_b", elements[node_b]), ("node_a_arrow", bool(node_a_arrow)),
+                                            ("node_b_arrow", bool(node_b_arrow)), ("text", text), ("color", color),
+                                            ("layout", edge_layouts[layout]),
+                                            ("node_a_border", borders[node_a_border]),
+                                            ("node_b_border", borders[node_b_border])))
+        # Edges are added to their node borders in creation order, as when they were built
+        for (node, border, border_order) in ((edge.node_a, edge.node_a_border, node_a_border_order),
+                                             (edge.node_b, edge.node_b_border, node_b_border_order)):
+            if isinstance(node, Node):
+                node.addEdge(border, border_order, edge)
+        chart.all_edges.append(edge)
+
+    # Clusters can reference clusters saved after them, so all clusters are created before setting children
+    chart.all_clusters = [restoreElement(Cluster, chart, (("text", text), ("color", color), ("rounded", bool(rounded))))
+                          for (text, color, rounded) in zip(columns["cluster_text"], columns["cluster_color"],
+                                                            columns["cluster_rounded"])]
+    elements = elements + chart.all_edges + chart.all_clusters
+    children = columns["cluster_children"]
+    start = 0
+    for cluster, end in zip(chart.all_clusters, columns["cluster_children_end"]):
+        object.__setattr__(cluster, "children", [elements[i] for i in children[start:end]])
+        start = end
+
+    chart.invalidateGeometry()
+    return chart
+
+
+# Load a chart saved with Chart.save, the returned chart can be modified and exported directly
+def loadChart(filename):
+    if filename.endswith(".json"):
+        with open(filename) as file:
+            model = json.load(file)
+        checkModelHeader(filename, model)
+        (parameters, columns) = (model["parameters"], model["columns"])
+    else:
+        (parameters, columns) = readBinaryModel(filename)
+    chart = createChartFromModel(parameters, columns)
+    logger.info("Chart loaded from %s : %d nodes, %d edges", filename, len(chart.all_nodes), len(chart.all_edges))
+    return chart
+
+
+# Write a chunk to an asynchronous writer, waiting until it accepts more data
+async def writeChunk(writer, chunk):
+    import inspect
+    result = writer.write(chunk)
+    if inspect.isawaitable(result):
+        await result
+    drain = getattr(writer, "drain", None)
+    if drain is not None:
+        await drain()
+
+
+# Return the (svg bytes, ExportStats) of chart, run in another process by Chart.writeSvgAsync
+def getChartSvg(chart, compress, export_args):
+    stream = io.BytesIO()
+    stats = chart.writeSvgStream(stream, compress, **export_args)
+    return (stream.getvalue(), stats)
+
+
+class BatchExportResult:
+    # Result of one chart export in exportSvgBatch, error is the formatted exception if the export failed
+
+    def __init__(self, filename, seconds, stats=None, error=None):
+        self.filename = filename
+        self.seconds = seconds
+        self.stats = stats
+        self.error = error
+
+
+# chart_data is the pickled chart definition (see exportSvgBatch)
+def exportChart(filename, chart_data, export_args):
+    start = time.perf_counter()
+    try:
+        chart_definition = pickle.loads(chart_data)
+        chart = chart_definition if isinstance(chart_definition, Chart) else chart_definition()
+        return BatchExportResult(filename, time.perf_counter() - start, stats=chart.exportSvg(filename, **export_args))
+    except Exception:
+        # A failing chart must not stop the other exports of the batch
+        return BatchExportResult(filename, time.perf_counter() - start, error=traceback.format_exc())
+
+
+def exportChartChunk(chunk, export_args):
+    return [exportChart(filename, chart_data, export_args) for (index, filename, chart_data) in chunk]
+
+
+# Export a chart in its own process, so the process dying only fails this chart
+def exportChartInProcess(filename, chart_data, export_args):
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+    with ProcessPoolExecutor(1) as executor:
+        try:
+            return executor.submit(exportChart, filename, chart_data, export_args).result()
+        except BrokenProcessPool:
+            return BatchExportResult(filename, 0, error=traceback.format_exc())
+
+
+# Export many independent charts in parallel with a process pool
+# charts is a list of (filename, chart definition), where a chart definition is a Chart
+# or a picklable callable returning a Chart (module level function, functools.partial, ...)
+# Definitions are pickled before being grouped in chunks, so a definition which can not be pickled only fails
+# its own chart. Charts are sent to the processes by chunks of chunk_size (by default, about 4 chunks per process)
+# A process dying (crash, os._exit, out of memory) breaks the whole pool : the charts not exported yet are then
+# exported again, each one in its own process, so only the chart killing its process fails
+# export_args are passed to Chart.exportSvg
+# Return a BatchExportResult for each chart, in the same order
+def exportSvgBatch(charts, max_workers=None, chunk_size=None, **export_args):
+    charts = list(charts)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    results = [None] * len(charts)
+    items = []
+    for index, (filename, chart_definition) in enumerate(charts):
+        try:
+            if not isinstance(chart_definition, Chart) and not callable(chart_definition):
+                raise TypeError(F"chart definition of {filename} is not a Chart nor a callable")
+            items.append((index, filename, pickle.dumps(chart_definition)))
+        except Exception:
+            results[index] = BatchExportResult(filename, 0, error=traceback.format_exc())
+
+    if chunk_size is None:
+        chunk_size = max(1, len(items) // (max_workers * 4))
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+    from concurrent.futures.process import BrokenProcessPool
+    unfinished = []
+    with ProcessPoolExecutor(max_workers) as executor:
+        futures = {executor.submit(exportChartChunk, chunk, export_args): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                for (index, filename, chart_data), result in zip(chunk, future.result()):
+                    results[index] = result
+            except BrokenProcessPool:
+                # This chunk may not be the one which killed its process
+                unfinished.extend(chunk)
+            except Exception:
+                error = traceback.format_exc()
+                for (index, filename, chart_data) in chunk:
+                    results[index] = BatchExportResult(filename, 0, error=error)
+
+    if len(unfinished) > 0:
+        logger.warning("Process pool broken, %d charts exported again in their own process", len(unfinished))
+        # Threads only wait for the processes
+        with ThreadPoolExecutor(max_workers) as executor:
+            for (index, filename, chart_data), result in zip(unfinished, executor.map(
+                    lambda item: exportChartInProcess(item[1], item[2], export_args), unfinished)):
+                results[index] = result
+
+    failure_count = sum(result.error is not None for result in results)
+    logger.info("%d charts exported, %d failed", len(results) - failure_count, failure_count)
+    return results
+
+
+# Chart spec : a json object describing a chart, rendered by the command line
+# {
+#   "chart": {"node_width": 200, ...},                     Chart parameters
+#   "nodes": [{"id": "a", "col": 0, "row": 0, "text": "A", "color": "white", "shape": "DIAMOND"}, ...],
+#   "points": [{"id": "p", "col": 1, "row": 2}, ...],
+#   "edges": [{"node_a": "a", "node_b": "b", "edge_string": "->", "text": "", "color": "black",
+#              "layout": "TOP_BOTTOM_CURVED", "node_a_border_order": 0, "node_b_border_order": 0}, ...],
+#   "clusters": [{"id": "c", "children": ["a", "b"], "text": "", "color": "none", "rounded": false}, ...],
+#   "order_edges": false,                                  see Chart.orderEdgesOnBorders
+#   "export": {"css": true, "precision": 1, "viewport": [min_x, max_x, min_y, max_y], "size": [w, h]}
+# }
+# Elements are referenced by id, the text of nodes and clusters by default
+# Nodes without col and row are positioned by Chart.layoutNodes
+# Clusters can only reference elements defined before them (nodes, points and previous clusters)
+# Return the chart and its export arguments
+def createChartFromSpec(spec):
+    chart = Chart(**spec.get("chart", {}))
+    elements = {}
+
+    def getElement(element_id):
+        if element_id not in elements:
+            raise ValueError(F"Unknown element '{element_id}' in chart spec")
+        return elements[element_id]
+
+    for node_spec in spec.get("nodes", []):
+        node = Node(chart, node_spec.get("col"), node_spec.get("row"), node_spec.get("text", ""),
+                    node_spec.get("color", "white"), toEnum(NodeShape, node_spec.get("shape", "RECTANGLE")))
+        elements[node_spec.get("id", node.text)] = node
+    for point_spec in spec.get("points", []):
+        elements[point_spec["id"]] = Point(chart, point_spec["col"], point_spec["row"])
+    for edge_spec in spec.get("edges", []):
+        Edge(chart, getElement(edge_spec["node_a"]), getElement(edge_spec["node_b"]),
+             edge_spec.get("edge_string", "-"), edge_spec.get("text", ""), edge_spec.get("color", "black"),
+             toEnum(EdgeLayout, edge_spec.get("layout", "AUTO")),
+             edge_spec.get("node_a_border_order"), edge_spec.get("node_b_border_order"))
+    for cluster_spec in spec.get("clusters", []):
+        cluster = Cluster(chart, [getElement(child) for child in cluster_spec["children"]],
+                          cluster_spec.get("text", ""), cluster_spec.get("color", "none"),
+                          cluster_spec.get("rounded", False))
+        elements[cluster_spec.get("id", cluster.text)] = cluster
+
+    if not all(node.isPositioned() for node in chart.all_nodes):
+        chart.layoutNodes()
+    if spec.get("order_edges", False):
+        chart.orderEdgesOnBorders()
+
+    export_args = dict(spec.get("export", {}))
+    if export_args.get("viewport") is not None:
+        export_args["viewport"] = Rect(*export_args["viewport"])
+    if export_args.get("size") is not None:
+        export_args["size"] = tuple(export_args["size"])
+    return (chart, export_args)
+
+
+# Render a chart spec to filename, with the streaming writer (drawsvg is not needed)
+def renderSpec(spec, filename):
+    (chart, export_args) = createChartFromSpec(spec)
+    export_args.setdefault("streaming", True)
+    return chart.exportSvg(filename, **export_args)
+
+
+# Render the requests read from input, a binary stream of json lines :
+#   {"spec": {...} or "spec_file": "chart.json", "output": "chart.svg"}
+# and write a json line response to output for each request :
+#   {"output": "chart.svg", "seconds": 0.1, "counts": {...}} or {"error": "traceback"}
+# Without output in the request, the svg is returned in the response "svg" field
+def runWorker(input, output):
+    for line in input:
+        if line.strip() == b"":
+            continue
+        start = time.perf_counter()
+        try:
+            request = json.loads(line)
+            spec = request.get("spec")
+            if spec is None:
+                with open(request["spec_file"]) as file:
+                    spec = json.load(file)
+            if request.get("output") is not None:
+                stats = renderSpec(spec, request["output"])
+                response = {"output": request["output"], "counts": stats.counts}
+            else:
+                (chart, export_args) = createChartFromSpec(spec)
+                # streaming is the only exportSvg option getSvgBytes does not take, it always streams
+                export_args.pop("streaming", None)
+                response = {"svg": chart.getSvgBytes(**export_args).decode()}
+            response["seconds"] = time.perf_counter() - start
+        except Exception:
+            # A failing request does not stop the worker
+            response = {"error": traceback.format_exc(), "seconds": time.perf_counter() - start}
+        output.write((json.dumps(response) + "\n").encode())
+        output.flush()
+
+
+# Serve runWorker on a unix socket, each connection sends requests and reads responses
+def runSocketWorker(path):
+    import socketserver
+
+    class WorkerHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            runWorker(self.rfile, self.wfile)
+
+    if os.path.exists(path):
+        os.remove(path)
+    with socketserver.UnixStreamServer(path, WorkerHandler) as server:
+        logger.info("Worker listening on %s", path)
+        server.serve_forever()
+
+
+def main(arguments=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m svg_chart", description="Render json chart specs to svg")
+    parser.add_argument("specs", nargs="*",
+                        help="chart spec files, each rendered to a svg file with the same name")
+    parser.add_argument("-o", "--output", help="output file of a single spec, compressed if ending with '.svgz'")
+    parser.add_argument("--worker", action="store_true",
+                        help="render requests read as json lines from stdin (see runWorker)")
+    parser.add_argument("--socket", help="with --worker, read requests from this unix socket instead of stdin")
+    args = parser.parse_args(arguments)
+
+    if args.worker:
+        if args.socket is not None:
+            runSocketWorker(args.socket)
+        else:
+            runWorker(sys.stdin.buffer, sys.stdout.buffer)
+        return 0
+
+    if len(args.specs) == 0:
+        parser.error("a spec file, or --worker, is required")
+    if args.output is not None and len(args.specs) != 1:
+        parser.error("--output requires a single spec")
+    failure_count = 0
+    for spec_filename in args.specs:
+        output = args.output or os.path.splitext(spec_filename)[0] + ".svg"
+        try:
+            with open(spec_filename) as file:
+                renderSpec(json.load(file), output)
+            print(F"{spec_filename} -> {output}")
+        except Exception as exception:
+            failure_count += 1
+            print(F"{spec_filename} : {exception}", file=sys.stderr)
+    return 1 if failure_count > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+# Scaling benchmark of chart construction and svg export
+#
+# Run all scenarios and save results :
+#   python svg_chart_benchmark.py --output results.json
+# Compare with a previous run, exit code is 1 if a regression is detected :
+#   python svg_chart_benchmark.py --output results.json --baseline baseline.json
+#
+# Each case runs in a fresh process so peak RSS is measured for this case only
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from svg_chart import *
+
+CURVED_LAYOUTS = [EdgeLayout.TOP_BOTTOM_CURVED, EdgeLayout.TOP_TOP_CURVED, EdgeLayout.BOTTOM_BOTTOM_CURVED,
+                  EdgeLayout.LEFT_RIGHT_CURVED, EdgeLayout.RIGHT_RIGHT_CURVED, EdgeLayout.LEFT_LEFT_CURVED]
+
+# Metrics compared with the baseline, a higher value is a regression
+COMPARED_METRICS = ["construction_seconds", "export_seconds", "peak_rss_bytes", "output_bytes"]
+
+
+# Each scenario builds a chart with about element_count nodes + edges + clusters
+
+def buildGrid(chart, element_count):
+    # Nodes on a square grid, connected to their right and bottom neighbours
+    side = max(2, int(math.sqrt(element_count / 3)))
+    nodes = chart.addNodes([i % side for i in range(side * side)], [i // side for i in range(side * side)],
+                           [str(i) for i in range(side * side)])
+    for i, node in enumerate(nodes):
+        if i % side < side - 1:
+            Edge(chart, node, nodes[i + 1], "->")
+        if i + side < len(nodes):
+            Edge(chart, node, nodes[i + side], "--")
+
+
+def buildHub(chart, element_count):
+    # All spokes connected to the same hub border (heavy single border fan-in)
+    spoke_count = max(1, element_count // 2)
+    hub = Node(chart, spoke_count / 2, 0, "hub")
+    for i in range(spoke_count):
+        Edge(chart, hub, Node(chart, i, 3, str(i)), "->")
+
+
+def buildNestedClusters(chart, element_count, branching=4):
+    # Leaf clusters of branching nodes, recursively grouped by branching clusters
+    node_count = max(branching, element_count * (branching - 1) // branching)
+    children = [Node(chart, i, 0, str(i)) for i in range(node_count)]
+    depth = 0
+    while len(children) > 1:
+        depth += 1
+        children = [Cluster(chart, children[i:i + branching], F"level {depth}")
+                    for i in range(0, len(children), branching)]
+
+
+def buildCurved(chart, element_count):
+    # Chain of diagonal nodes connected with all curved layouts
+    side = max(2, int(math.sqrt(element_count)))
+    previous = None
+    for i in range(max(2, element_count // 2)):
+        node = Node(chart, (i // side) + (i % side), i % side, str(i))
+        if previous is not None and i % side != 0:
+            Edge(chart, previous, node, "->", layout=CURVED_LAYOUTS[i % len(CURVED_LAYOUTS)])
+        previous = node
+
+
+SCENARIOS = {
+    "grid": buildGrid,
+    "hub": buildHub,
+    "nested_clusters": buildNestedClusters,
+    "curved": buildCurved,
+}
+
+
+def getPeakRss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def runCase(scenario, element_count, streaming):
+    start = time.perf_counter()
+    chart = Chart()
+    SCENARIOS[scenario](chart, element_count)
+    construction_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "benchmark.svg")
+        start = time.perf_counter()
+        stats = chart.exportSvg(filename, streaming=streaming)
+        export_seconds = time.perf_counter() - start
+        output_bytes = os.path.getsize(filename)
+
+    return {"scenario": scenario,
+            "element_count": element_count,
+            "streaming": streaming,
+            "counts": stats.counts,
+            "construction_seconds": construction_seconds,
+            "export_seconds": export_seconds,
+            "export_phases_seconds": {phase: seconds for phase, (seconds, blocks) in stats.phases.items()},
+            "peak_rss_bytes": getPeakRss(),
+            "output_bytes": output_bytes}
+
+
+def getCaseKey(result):
+    return (result["scenario"], result["element_count"], result["streaming"])
+
+
+# Return a description of each metric that is worse than the baseline by more than threshold (relative)
+def compareResults(results, baseline_results, threshold):
+    baseline_by_key = {getCaseKey(result): result for result in baseline_results}
+    regressions = []
+    for result in results:
+        baseline = baseline_by_key.get(getCaseKey(result))
+        if baseline is None:
+            continue
+        for metric in COMPARED_METRICS:
+            value = result[metric]
+            baseline_value = baseline[metric]
+            if value is None or not baseline_value:
+                continue
+            ratio = value / baseline_value
+            if ratio > 1 + threshold:
+                regressions.append(F"{result['scenario']} {result['element_count']} "
+                                   F"{'streaming ' if result['streaming'] else ''}{metric} : "
+                                   F"{baseline_value:.4g} -> {value:.4g} (x{ratio:.2f})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="svg_chart scaling benchmark")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000],
+                        help="approximate element counts (up to 1000000)")
+    parser.add_argument("--streaming", action="store_true", help="export with the streaming svg writer")
+    parser.add_argument("--output", help="json file where results are saved")
+    parser.add_argument("--baseline", help="json file of previous results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative increase reported as a regression (default 0.2)")
+    args = parser.parse_args()
+
+    results = []
+    for scenario in args.scenarios:
+        for element_count in args.sizes:
+            # A new process per case, so peak RSS does not include previous cases
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(runCase, scenario, element_count, args.streaming).result()
+            results.append(result)
+            peak_rss_mb = (result['peak_rss_bytes'] or 0) / 2**20
+            print(F"{scenario:16} {element_count:>8} : construction {result['construction_seconds']:8.3f} s, "
+                  F"export {result['export_seconds']:8.3f} s, peak RSS {peak_rss_mb:8.1f} MB, "
+                  F"output {result['output_bytes'] / 2**20:8.1f} MB")
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump({"python": sys.version, "results": results}, file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline_results = json.load(file)["results"]
+        regressions = compareResults(results, baseline_results, args.threshold)
+        for regression in regressions:
+            print(F"REGRESSION {regression}")
+        if len(regressions) > 0:
+            sys.exit(1)
+        print("No regression")
+
+
+if __name__ == "__main__":
+    main()